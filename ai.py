@@ -1,5 +1,15 @@
 import numpy as np
-import copy
+import json
+import random
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from board import Board
+from transposition import TranspositionTable, SharedTable
+from searchstats import SearchStats
+import heuristics
+import bitboard
+import npboard
 
 #=================================================================================================
 # Minimax & alpha-beta pruning: 
@@ -12,122 +22,693 @@ import copy
 # - Merges, free tiles: https://stackoverflow.com/questions/22342854/what-is-the-optimal-algorithm-for-the-game-2048
 #=================================================================================================
 
+# raised inside the search when a timed getNextMove runs past its deadline or the search is cancelled
+class SearchTimeout(Exception):
+    pass
+
 class AISolver:
-    def __init__(self, board):
+    # deepest iteration a timed search will attempt
+    MAX_ITERATIVE_DEPTH = 12
+    MODES = ['expectimax', 'minimax', 'montecarlo']
+
+    # maxDepth: number of (spawn, move) plies searched below each root move
+    # tableSize: max entries kept in the transposition table (0 disables it); a ready-made table
+    #            can be passed in instead to share it between solvers
+    # weights: overrides for heuristics.DEFAULT_WEIGHTS used by calculateFinalScore
+    # workers: size of the process pool used to score root moves in parallel (0 = sequential);
+    #          parallelChance also splits each root move into its (tile, value) spawn branches;
+    #          sharedTable gives all workers one shared-memory table of tableSize slots instead of
+    #          a private table each
+    # timeLimit: per-move time budget in seconds; when set, getNextMove deepens 1, 2, 3, ... until
+    #            the budget runs out instead of searching to maxDepth (lastDepth reports the depth)
+    # probCutoff: chance nodes reached with a cumulative probability below this are not expanded
+    #             and get their static evaluation instead (0 disables the cutoff)
+    # sampleCells: on boards with more empty cells than this, chance nodes expand only this many
+    #              (deterministically sampled) cells (None expands every cell)
+    # batchLeaves: score the leaves below each last chance layer as one NumPy batch, and play
+    #              Monte Carlo playouts on 4x4 boards in lockstep as one npboard.BatchBoard
+    # mode: 'expectimax' (expected value over random spawns), 'minimax' (worst-case spawns, see
+    #       getNextMoveMinimax) or 'montecarlo' (random playouts, see getNextMoveMonteCarlo)
+    # playouts: Monte Carlo playouts per root move; with timeLimit, fewer if the budget runs out
+    # playoutDepth: moves per playout before it is cut off (None plays to the end of the game)
+    # seed: seeds the playout RNG, so Monte Carlo moves are reproducible
+    # instrument: collect a SearchStats object per getNextMove call (kept in lastStats);
+    #             traceCallback(stats) is called after every move and turns instrumentation on
+    def __init__(self, board, maxDepth=2, tableSize=500000, table=None, weights=None,
+                 workers=0, parallelChance=False, timeLimit=None, probCutoff=0, sampleCells=None,
+                 batchLeaves=True, instrument=False, traceCallback=None, sharedTable=False,
+                 mode='expectimax', playouts=200, playoutDepth=None, seed=None):
         self.board = board        
+        self.weights = heuristics.getWeights(weights)
+        self.evaluator = heuristics.getEvaluator(weights, board.size if board is not None else bitboard.SIZE)
+        self.maxDepth = maxDepth
+        self.tableSize = tableSize
+        # a table passed in may be shared with other solvers or processes, or persist on disk
+        # (MappedTable), so the solver never clears it; see useSize
+        self.ownsTable = table is None
+        self.sharedSearchTable = table
+        if table is None and tableSize:
+            table = TranspositionTable(tableSize)
+        self.table = table
+        self.workers = workers
+        self.parallelChance = parallelChance
+        self.sharedTable = sharedTable
+        self.workerTable = None
+        self.pool = None
+        self.timeLimit = timeLimit
+        self.deadline = None
+        self.lastDepth = None
+        self.probCutoff = probCutoff
+        self.sampleCells = sampleCells
+        self.prunedNodes = 0
+        self.sampledNodes = 0
+        self.batchLeaves = batchLeaves
+        self.size = board.size if board is not None else bitboard.SIZE
+        self.batchFrontier = batchLeaves and self.size == bitboard.SIZE # npboard is 4x4 only
+        self.tableBoardSize = self.size # board size the values in a passed-in table belong to
+        self.instrument = instrument or traceCallback is not None
+        self.traceCallback = traceCallback
+        self.stats = None # SearchStats of the move being searched, None when not instrumented
+        self.lastStats = None
+        self.cancelToken = None # threading.Event of the search in progress, see cancel()
+        if mode not in AISolver.MODES:
+            raise ValueError(f'unknown search mode: {mode}')
+        self.mode = mode
+        # minimax values are bounds, so they get a table of their own rather than sharing self.table
+        self.minimaxTable = TranspositionTable(tableSize) if mode == 'minimax' and tableSize else None
+        self.engine = bitboard.getEngine(self.size)
+        self.killers = {}
+        self.history = {}
+        self.playouts = playouts
+        self.playoutDepth = playoutDepth
+        self.rng = random.Random(seed)
+
+    #=============================================================================================
+    # Worst-case (minimax) engine, selected with mode='minimax': the opponent places the spawned
+    # tile (a 2 or a 4 in any empty cell) wherever it hurts most, so the chosen move maximizes the
+    # guaranteed evaluation rather than the expected one. Depth means the same as for expectimax
+    # (maxDepth placement/move plies below each root move, leaves are afterstates), and the whole
+    # search runs on packed states:
+    # - alpha-beta with a transposition table of (flag, value, best child) per max node, so
+    #   values proven with a narrower window are reused as bounds
+    # - iterative deepening 1, 2, ..., maxDepth (or until the deadline with timeLimit); each
+    #   iteration tries the previous one's best child first, found under remaining depth - 1
+    # - killer moves (the last two children that caused a cutoff at each ply) and a history score
+    #   (depth squared per cutoff) order the remaining children, both for moves and placements
+    #=============================================================================================
+
+    EXACT, LOWER, UPPER = 0, 1, 2
+
+    def getNextMoveMinimax(self, board):
+        moves = board.getAvailableMoves()
+        if not moves:
+            return None
+        self.engine = board.engine
+        self.killers = {}
+        self.history = {}
+        rootChildren = [(move, self.engine.executeMove(board.state, move)[0]) for move in moves]
+        bestMove = moves[0]
+        maxDepth = AISolver.MAX_ITERATIVE_DEPTH if self.timeLimit is not None else self.maxDepth
+        if self.timeLimit is not None:
+            self.deadline = time.perf_counter() + self.timeLimit
+        self.lastDepth = 0
+        try:
+            for depth in range(maxDepth + 1):
+                iterationStart = time.perf_counter()
+                rootChildren.sort(key=lambda child: child[0] != bestMove)
+                alpha = -np.inf
+                iterationBest = rootChildren[0][0]
+                for move, afterstate in rootChildren:
+                    score = self.minValue(afterstate, depth, alpha, np.inf, 1)
+                    if score > alpha:
+                        alpha = score
+                        iterationBest = move
+                bestMove = iterationBest
+                self.lastDepth = depth
+                now = time.perf_counter()
+                if self.deadline is not None and now - iterationStart > self.deadline - now:
+                    break
+        except SearchTimeout:
+            if self.timeLimit is None:
+                raise
+        finally:
+            self.deadline = None
+        return bestMove
 
-    # minimax with alpha-beta pruning
-    def minimax(self, board, depth=7, alpha=-np.inf, beta=np.inf, maxNode=True):
+    # player to move: best of the legal moves, -inf when there is none (the game is lost)
+    def maxValue(self, state, depth, alpha, beta, ply):
+        if self.isCancelled() or (self.deadline is not None and time.perf_counter() > self.deadline):
+            raise SearchTimeout()
+        hint = None
+        if self.minimaxTable is not None:
+            entry = self.minimaxTable.get(state, depth)
+            if entry is not None:
+                flag, value, hint = entry
+                if flag == AISolver.EXACT:
+                    return value
+                if flag == AISolver.LOWER:
+                    alpha = max(alpha, value)
+                else:
+                    beta = min(beta, value)
+                if alpha >= beta:
+                    return value
+            elif depth > 1:
+                entry = self.minimaxTable.get(state, depth - 1)
+                if entry is not None:
+                    hint = entry[2]
+        alphaBefore = alpha
+        if self.stats is not None:
+            self.stats.maxNodes[ply // 2 - 1] += 1
+        children = []
+        for move in bitboard.DIRECTIONS:
+            newState = self.engine.executeMove(state, move)[0]
+            if newState != state:
+                children.append((move, newState))
+        if not children:
+            return -np.inf
+        bestValue = -np.inf
+        bestMove = None
+        for move, newState in self.orderChildren(children, hint, ply):
+            value = self.minValue(newState, depth - 1, alpha, beta, ply + 1)
+            if value > bestValue:
+                bestValue = value
+                bestMove = move
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                self.recordCutoff(move, depth, ply)
+                break
+        if self.minimaxTable is not None:
+            if bestValue <= alphaBefore:
+                flag = AISolver.UPPER
+            elif bestValue >= beta:
+                flag = AISolver.LOWER
+            else:
+                flag = AISolver.EXACT
+            self.minimaxTable.put(state, depth, (flag, bestValue, bestMove))
+        return bestValue
+
+    # opponent to move: the worst tile placement for the player; leaves are evaluated here
+    def minValue(self, afterstate, depth, alpha, beta, ply):
         if depth == 0:
-            return None, self.evaluate(board)
-        if board.gameOver():
-            return None, -np.inf
-        if board.winGame():
-            return None, np.inf
-        if maxNode:
-            maxEval = -np.inf
-            moves = board.getAvailableMoves()
-            bestMove = moves[0]
-            for move in moves:
-                boardCopy = copy.deepcopy(board)
-                boardCopy.performMove(move)
-                _, eval = self.minimax(boardCopy, depth-1, alpha, beta, False)
-                if eval > maxEval:
-                    maxEval = eval
-                    bestMove = move
-                alpha = max(alpha, eval)
-                if beta <= alpha:
-                    break         
-            return bestMove, maxEval            
-        else:            
-            minEval = np.inf
-            moves = board.getAvailableMoves()
-            worstMove = moves[0]
-            for move in moves:
-                boardCopy = copy.deepcopy(board)
-                boardCopy.performMove(move)
-                _, eval = self.minimax(boardCopy, depth-1, alpha, beta, True)
-                if eval < minEval:
-                    minEval = eval
-                    worstMove = move
-                minEval = min(minEval, eval)
-                beta = min(beta, eval)
-                if beta <= alpha:
+            if self.stats is not None:
+                self.stats.addLeaves(1, 0)
+            return self.evaluator.evaluate(afterstate)
+        if self.stats is not None:
+            self.stats.chanceNodes[ply // 2] += 1
+        children = []
+        for row, col in self.engine.getEmptyCells(afterstate):
+            for value in (2, 4):
+                children.append(((row, col, value), self.engine.setTile(afterstate, row, col, value)))
+        bestValue = np.inf
+        for placement, state in self.orderChildren(children, None, ply):
+            value = self.maxValue(state, depth, alpha, beta, ply + 1)
+            bestValue = min(bestValue, value)
+            beta = min(beta, value)
+            if alpha >= beta:
+                self.recordCutoff(placement, depth, ply)
+                break
+        return bestValue
+
+    # table move first, then this ply's killers, then the rest by history score
+    def orderChildren(self, children, hint, ply):
+        killers = self.killers.get(ply, ())
+        history = self.history
+        def priority(child):
+            key = child[0]
+            if key == hint:
+                return (0, 0)
+            if key in killers:
+                return (1, killers.index(key))
+            return (2, -history.get(key, 0))
+        return sorted(children, key=priority)
+
+    def recordCutoff(self, key, depth, ply):
+        killers = self.killers.setdefault(ply, [])
+        if key not in killers:
+            killers.insert(0, key)
+            del killers[2:]
+        self.history[key] = self.history.get(key, 0) + depth * depth
+
+    #=============================================================================================
+    # Monte Carlo engine, selected with mode='montecarlo': every root move is followed by playouts
+    # of random spawns and uniformly random legal moves, up to playoutDepth moves or the end of the
+    # game, and the move whose playouts score the most points on average is played. There is no
+    # evaluation function and no tree, so the cost is all raw move throughput: playouts are played
+    # round-robin over the root moves until `playouts` each or the timeLimit budget, whichever
+    # comes first, and with workers they are split evenly across the pool. On 4x4 boards (with
+    # batchLeaves) a whole round of playouts for every root move runs as one BatchBoard.
+    #=============================================================================================
+
+    # playouts per root move in one lockstep round when a time budget has to be checked between
+    # rounds; without one, rounds are only capped at MAX_PLAYOUT_ROUND, which bounds the batch's
+    # memory and how long a cancel() waits for the spawn step of a new round
+    PLAYOUT_ROUND = 32
+    MAX_PLAYOUT_ROUND = 1024
+
+    def getNextMoveMonteCarlo(self, board):
+        moves = board.getAvailableMoves()
+        if not moves:
+            return None
+        self.lastDepth = self.playoutDepth
+        if self.workers:
+            return self.getNextMoveMonteCarloParallel(board, moves)
+        totals, count = self.runPlayouts(board.state, board.size, moves, self.playouts, self.rng,
+                                         self.timeLimit)
+        return self.chooseMove(moves, [total / count for total in totals])
+
+    # one task per worker, each covering every root move, so all tasks run at once and the
+    # timeLimit budget (counted by each task from its start) bounds the whole move; the workers
+    # split one PLAYOUT_ROUND between them, so the round that always completes is no bigger than
+    # in a sequential search
+    # workers get an absolute wall-clock deadline rather than timeLimit, so the time spent starting
+    # the pool and handing out tasks comes out of the same budget
+    def getNextMoveMonteCarloParallel(self, board, moves):
+        deadline = None if self.timeLimit is None else time.time() + self.timeLimit
+        pool = self.getPool()
+        roundSize = max(1, AISolver.PLAYOUT_ROUND // self.workers)
+        tasks = []
+        for chunk in range(self.workers):
+            count = self.playouts // self.workers + (chunk < self.playouts % self.workers)
+            if count:
+                tasks.append((board.state, board.size, moves, count, self.rng.getrandbits(64),
+                              deadline, roundSize))
+        totals = [0] * len(moves)
+        played = 0
+        for chunkTotals, chunkPlayed in pool.map(workerRunPlayouts, tasks):
+            totals = [total + chunkTotal for total, chunkTotal in zip(totals, chunkTotals)]
+            played += chunkPlayed
+        return self.chooseMove(moves, [total / played for total in totals])
+
+    # up to count playouts after each of moves, in rounds, stopping after timeLimit seconds;
+    # returns (total points per move, playouts played per move). roundSize overrides PLAYOUT_ROUND
+    # for timed batched rounds. Playouts stop early at the deadline: a batched round is cut at the
+    # same step for every move, so its partial playouts are still scored, while a cut scalar round
+    # is dropped unless it is the first, whose moves share the budget in equal slices so every
+    # move still has a score.
+    def runPlayouts(self, state, size, moves, count, rng, timeLimit=None, roundSize=None):
+        engine = bitboard.getEngine(size)
+        batched = self.batchLeaves and size == bitboard.SIZE
+        if not batched:
+            roundSize = 1
+        elif timeLimit is None:
+            roundSize = min(count, AISolver.MAX_PLAYOUT_ROUND)
+        else:
+            roundSize = min(count, roundSize or AISolver.PLAYOUT_ROUND)
+        start = time.perf_counter()
+        deadline = None if timeLimit is None else start + timeLimit
+        totals = [0] * len(moves)
+        played = 0
+        while played < count:
+            if played and deadline is not None and time.perf_counter() > deadline:
+                break
+            playouts = min(roundSize, count - played)
+            if batched:
+                points = self.runPlayoutBatch(state, moves, playouts, rng, deadline)
+            elif played or deadline is None:
+                points = [self.runPlayout(engine, state, move, rng, deadline) for move in moves]
+                if deadline is not None and time.perf_counter() > deadline:
                     break
-            return worstMove, minEval
+            else:
+                share = timeLimit / len(moves)
+                points = [self.runPlayout(engine, state, move, rng, start + share * (i + 1))
+                          for i, move in enumerate(moves)]
+            totals = [total + gained for total, gained in zip(totals, points)]
+            played += playouts
+        return (totals, played)
+
+    # `playouts` playouts after each of moves in one BatchBoard, all stopped at the same step once
+    # deadline passes; returns the total points per move
+    def runPlayoutBatch(self, state, moves, playouts, rng, deadline=None):
+        afterstates = []
+        rootPoints = []
+        for move in moves:
+            afterstate, points = bitboard.executeMove(state, move)
+            afterstates.append(afterstate)
+            rootPoints.append(points)
+        batch = npboard.BatchBoard(states=np.repeat(npboard.toArray(afterstates), playouts),
+                                   seed=rng.getrandbits(64))
+        batch.spawnTiles()
+        steps = 0
+        while not batch.done.all() and (self.playoutDepth is None or steps < self.playoutDepth):
+            if self.isCancelled():
+                raise SearchTimeout()
+            if deadline is not None and time.perf_counter() > deadline:
+                break
+            batch.performMoves(batch.getRandomMoves())
+            steps += 1
+        scores = batch.scores.reshape(len(moves), playouts).sum(axis=1).tolist()
+        return [score + points * playouts for score, points in zip(scores, rootPoints)]
+
+    # one playout: points scored by move and the random game that follows it, up to deadline
+    def runPlayout(self, engine, state, move, rng, deadline=None):
+        if self.isCancelled():
+            raise SearchTimeout()
+        state, points = engine.executeMove(state, move)
+        directions = bitboard.DIRECTIONS
+        moves = 0
+        while self.playoutDepth is None or moves < self.playoutDepth:
+            if deadline is not None and time.perf_counter() > deadline:
+                break
+            row, col = rng.choice(engine.getEmptyCells(state))
+            state = engine.setTile(state, row, col, 2 if rng.random() < 0.9 else 4)
+            # a random direction, or if it doesn't move anything a random one of the legal ones,
+            # which picks each legal move with the same probability
+            newState, gained = engine.executeMove(state, directions[rng.randrange(4)])
+            if newState == state:
+                legal = []
+                for direction in directions:
+                    result = engine.executeMove(state, direction)
+                    if result[0] != state:
+                        legal.append(result)
+                if not legal:
+                    break
+                newState, gained = rng.choice(legal)
+            state = newState
+            points += gained
+            moves += 1
+        return points
+
+    # cancelToken: a threading.Event that stops this search once set; every call gets a fresh one
+    # when none is given, so a cancel() aimed at an earlier search never carries over
+    def getNextMove(self, board, cancelToken=None):
+        self.cancelToken = cancelToken if cancelToken is not None else threading.Event()
+        if not self.instrument:
+            return self.searchNextMove(board)
+        self.stats = SearchStats()
+        table = self.minimaxTable if self.mode == 'minimax' else self.table
+        tableBefore = table.getStats() if table is not None else None
+        prunedBefore, sampledBefore = self.prunedNodes, self.sampledNodes
+        startTime = time.perf_counter()
+        try:
+            move = self.searchNextMove(board)
+        finally:
+            stats = self.stats
+            self.stats = None
+        stats.totalSeconds = time.perf_counter() - startTime
+        stats.move = move
+        stats.depth = self.lastDepth
+        if tableBefore is not None:
+            tableAfter = table.getStats()
+            stats.cacheHits = tableAfter['hits'] - tableBefore['hits']
+            stats.cacheMisses = tableAfter['misses'] - tableBefore['misses']
+            stats.cacheEvictions = tableAfter['evictions'] - tableBefore['evictions']
+        stats.prunedNodes = self.prunedNodes - prunedBefore
+        stats.sampledNodes = self.sampledNodes - sampledBefore
+        self.lastStats = stats
+        if self.traceCallback is not None:
+            self.traceCallback(stats)
+        return move
 
-    # expectimax
-    def getNextMove(self, board):
+    def searchNextMove(self, board):
+        self.useSize(board.size)
+        if self.mode == 'minimax':
+            return self.getNextMoveMinimax(board)
+        if self.mode == 'montecarlo':
+            return self.getNextMoveMonteCarlo(board)
+        if self.timeLimit is not None:
+            return self.getNextMoveTimed(board)
+        self.lastDepth = self.maxDepth
+        if self.workers:
+            return self.getNextMoveParallel(board)
+        moves = board.getAvailableMoves()
+        return self.chooseMove(moves, [self.calculateScore(board, move) for move in moves])
+
+    # switches evaluator and leaf batching over when the solver is handed a board of another size.
+    # Packed states of different sizes can collide, so the solver's own table is cleared, while a
+    # passed-in table is simply not consulted until the solver is back on its board size (clearing
+    # it would wipe values other solvers, processes or later runs rely on)
+    def useSize(self, size):
+        if size == self.size:
+            return
+        self.size = size
+        self.evaluator = heuristics.getEvaluator(self.weights, size)
+        self.batchFrontier = self.batchLeaves and size == bitboard.SIZE
+        if self.ownsTable:
+            if self.table is not None:
+                self.table.clear()
+        else:
+            self.table = self.sharedSearchTable if size == self.tableBoardSize else None
+        if self.minimaxTable is not None:
+            self.minimaxTable.clear()
+
+    # first move with the strictly highest score, so ties resolve the same way in every mode
+    def chooseMove(self, moves, scores):
         bestMove = None
         bestScore = -np.inf
-        for move in board.getAvailableMoves():
-            score = self.calculateScore(board, move)
+        for move, score in zip(moves, scores):
             if score > bestScore:
                 bestScore = score
                 bestMove = move
         return bestMove
-    
-    def calculateScore(self, board, move):
-        newBoard = copy.deepcopy(board)
-        newBoard.performMove(move)
-        if newBoard == board:
+
+    # root-parallel expectimax: every root move (or every spawn branch below it) is an independent
+    # subtree, scored on the persistent worker pool and combined in the sequential order, so the
+    # chosen move is exactly the one getNextMove picks sequentially
+    def getNextMoveParallel(self, board):
+        pool = self.getPool()
+        moves = board.getAvailableMoves()
+        if not (self.parallelChance and self.maxDepth > 0):
+            scores = list(pool.map(workerCalculateScore, [(board.state, board.size, move) for move in moves]))
+            return self.chooseMove(moves, scores)
+        branchWeights = []
+        tasks = []
+        for move in moves:
+            afterstate, _, _ = board.getAfterstate(move)
+            children = self.getChanceChildren(afterstate)
+            branchWeights.append([weight for weight, _ in children])
+            tasks.extend((child.state, board.size, weight) for weight, child in children)
+        chunkSize = max(1, len(tasks) // (4 * self.workers))
+        branchScores = iter(pool.map(workerCalculateBranchScore, tasks, chunksize=chunkSize))
+        scores = []
+        for weights in branchWeights:
+            totalScore = 0
+            for weight in weights:
+                totalScore += weight * next(branchScores)
+            scores.append(totalScore)
+        return self.chooseMove(moves, scores)
+
+    # iterative deepening under a per-move deadline: returns the best move of the deepest
+    # completed iteration; an iteration cut off by the deadline is discarded
+    def getNextMoveTimed(self, board):
+        startTime = time.perf_counter()
+        previousDepth = self.lastDepth
+        moves = board.getAvailableMoves()
+        if not moves:
+            return None
+        # depth 0 (static evaluation of each afterstate) is cheap and always completes
+        bestMove = self.chooseMove(moves, [self.calculateScore(board, move, 0) for move in moves])
+        self.lastDepth = 0
+        # tree reuse: the iterations that are already in the table are skipped
+        if previousDepth:
+            cachedDepth, cachedScores = self.getCachedRootScores(board, moves, previousDepth)
+            if cachedScores:
+                bestMove = self.chooseMove(moves, cachedScores)
+                self.lastDepth = cachedDepth
+        self.deadline = startTime + self.timeLimit
+        try:
+            for depth in range(self.lastDepth + 1, AISolver.MAX_ITERATIVE_DEPTH + 1):
+                iterationStart = time.perf_counter()
+                scores = [self.calculateScore(board, move, depth) for move in moves]
+                bestMove = self.chooseMove(moves, scores)
+                self.lastDepth = depth
+                # the next iteration costs at least as much as this one, so don't start it
+                # if it can't finish in the time that is left
+                now = time.perf_counter()
+                if now - iterationStart > self.deadline - now:
+                    break
+        except SearchTimeout:
+            pass
+        finally:
+            self.deadline = None
+        return bestMove
+
+    # The previous move's search already scored this position's afterstates: after its move and
+    # the actual spawn, they were the chance nodes one ply below its root, searched to its depth
+    # minus one. Returns the deepest depth (at most maxDepth) at which the table holds every root
+    # score, with those scores, i.e. the iteration the next search can start extending from;
+    # (0, None) when the subtree isn't cached.
+    def getCachedRootScores(self, board, moves, maxDepth):
+        if self.table is None:
+            return (0, None)
+        afterstates = [board.getAfterstate(move)[0].state for move in moves]
+        for depth in range(maxDepth, 0, -1):
+            scores = [self.table.get(state, depth) for state in afterstates]
+            if None not in scores:
+                return (depth, scores)
+        return (0, None)
+
+    # called from another thread to stop the running search at its next chance node: a fixed-depth
+    # search raises SearchTimeout, a timed one returns the move of its last completed iteration.
+    # A search that hasn't started yet is only stopped through its own cancelToken.
+    def cancel(self):
+        cancelToken = self.cancelToken
+        if cancelToken is not None:
+            cancelToken.set()
+
+    def isCancelled(self):
+        return self.cancelToken is not None and self.cancelToken.is_set()
+
+    def getPool(self):
+        if self.pool is None:
+            options = {'maxDepth': self.maxDepth,
+                       'tableSize': self.tableSize,
+                       'weights': self.weights,
+                       'probCutoff': self.probCutoff,
+                       'sampleCells': self.sampleCells,
+                       'batchLeaves': self.batchLeaves,
+                       'playoutDepth': self.playoutDepth}
+            if self.sharedTable and self.tableSize:
+                self.workerTable = SharedTable(self.tableSize)
+                options['sharedTable'] = self.workerTable.getAddress()
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=initWorker,
+                                            initargs=(options,))
+        return self.pool
+
+    # shut down the worker pool (if any) and free its shared table; the solver can still be used
+    # sequentially afterwards
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        if self.workerTable is not None:
+            self.workerTable.close()
+            self.workerTable = None
+
+    def calculateScore(self, board, move, maxDepth=None):
+        if maxDepth is None:
+            maxDepth = self.maxDepth
+        newBoard, _, changed = board.getAfterstate(move)
+        if not changed:
             return 0
-        return self.generateScore(newBoard, 0, 2)
+        return self.generateScore(newBoard, 0, maxDepth)
     
-    def generateScore(self, board, currentDepth, maxDepth):
+    # chance node: expected value over every spawn; probability is the cumulative probability
+    # of reaching this node from the root
+    def generateScore(self, board, currentDepth, maxDepth, probability=1.0):
         if currentDepth == maxDepth:
+            if self.stats is not None:
+                return self.evaluateLeafInstrumented(board)
+            return self.calculateFinalScore(board)
+        if self.isCancelled() or (self.deadline is not None and time.perf_counter() > self.deadline):
+            raise SearchTimeout()
+        if probability < self.probCutoff:
+            self.prunedNodes += 1
+            if self.stats is not None:
+                return self.evaluateLeafInstrumented(board)
             return self.calculateFinalScore(board)
+        # the same afterstate is reached through many move orders, so reuse its value
+        remainingDepth = maxDepth - currentDepth
+        if self.table is not None:
+            cachedScore = self.table.get(board.state, remainingDepth)
+            if cachedScore is not None:
+                return cachedScore
+        if self.stats is not None:
+            self.stats.chanceNodes[currentDepth] += 1
+        children = self.getChanceChildren(board)
+        if not children:
+            return self.calculateFinalScore(board)
+        approximateBefore = self.prunedNodes + self.sampledNodes
+        if self.batchFrontier and remainingDepth == 1:
+            if self.stats is not None:
+                self.stats.maxNodes[currentDepth] += len(children)
+            totalScore = self.generateFrontierScore(children)
+        else:
+            totalScore = 0
+            for weight, newBoard in children:
+                totalScore += weight * self.calculateMoveScore(newBoard, currentDepth, maxDepth,
+                                                              probability * weight)
+        # only exact values are cached, so a cut-off or sampled subtree never leaks into other
+        # searches through the table
+        if self.table is not None and self.prunedNodes + self.sampledNodes == approximateBefore:
+            self.table.put(board.state, remainingDepth, totalScore)
+        return totalScore
+
+    # last chance layer in one batch: every (spawn, move) leaf below it is moved and evaluated as
+    # a NumPy array, then reduced exactly like calculateMoveScore/generateScore would (best move
+    # per spawn, floored at 0, then the probability-weighted sum in spawn order)
+    def generateFrontierScore(self, children):
+        childStates = npboard.toArray([child.state for _, child in children])
+        bestScores = np.zeros(len(children))
+        for move in bitboard.DIRECTIONS:
+            newStates, _ = npboard.executeMoves(childStates, move)
+            if self.stats is not None:
+                startTime = time.perf_counter()
+                scores = self.evaluator.evaluateBatch(newStates)
+                self.stats.addLeaves(int(np.count_nonzero(newStates != childStates)),
+                                     time.perf_counter() - startTime)
+            else:
+                scores = self.evaluator.evaluateBatch(newStates)
+            bestScores = np.where(newStates != childStates, np.maximum(scores, bestScores), bestScores)
         totalScore = 0
-        for emptyTile in board.getEmptyTiles():
+        for (weight, _), bestScore in zip(children, bestScores.tolist()):
+            totalScore += weight * bestScore
+        return totalScore
+
+    # spawn branches of an afterstate in search order as (probability, board) pairs
+    def getChanceChildren(self, board):
+        emptyTiles = board.getEmptyTiles()
+        if self.sampleCells and len(emptyTiles) > self.sampleCells:
+            # seeded by the position so every search (and every worker) samples the same cells
+            emptyTiles = sorted(random.Random(board.state).sample(emptyTiles, self.sampleCells))
+            self.sampledNodes += 1
+        children = []
+        for emptyTile in emptyTiles:
             # simulate placing a '2', which has 90% chance of happening
-            newBoard2 = copy.deepcopy(board)
-            newBoard2.addTile(emptyTile, 2)
-            moveScore2 = self.calculateMoveScore(newBoard2, currentDepth, maxDepth)
-            totalScore += 0.9 * moveScore2
+            children.append((0.9 / len(emptyTiles), board.withTile(emptyTile, 2)))
             # simulate placing a '4', which has 10% chance of happening
-            newBoard4 = copy.deepcopy(board)
-            newBoard4.addTile(emptyTile, 2)
-            moveScore4 = self.calculateMoveScore(newBoard4, currentDepth, maxDepth)
-            totalScore += 0.1 * moveScore4
-        return totalScore
+            children.append((0.1 / len(emptyTiles), board.withTile(emptyTile, 4)))
+        return children
 
-    def calculateMoveScore(self, board, currentDepth, maxDepth):
+    def calculateMoveScore(self, board, currentDepth, maxDepth, probability=1.0):
+        if self.stats is not None:
+            self.stats.maxNodes[currentDepth] += 1
         bestScore = 0
         for move in ['left', 'right', 'up', 'down']:
-            newBoard = copy.deepcopy(board)
-            newBoard.performMove(move)
-            if newBoard.getBoard() != board.getBoard():
-                score = self.generateScore(newBoard, currentDepth+1, maxDepth)
+            newBoard, _, changed = board.getAfterstate(move)
+            if changed:
+                score = self.generateScore(newBoard, currentDepth+1, maxDepth, probability)
                 bestScore = max(score, bestScore)
         return bestScore
 
+    # pruning/sampling counters since the solver was created (or last reset)
+    def getSearchCounters(self):
+        return {'prunedNodes': self.prunedNodes, 'sampledNodes': self.sampledNodes}
+
+    def resetSearchCounters(self):
+        self.prunedNodes = 0
+        self.sampledNodes = 0
+
+    def evaluateLeafInstrumented(self, board):
+        startTime = time.perf_counter()
+        score = self.calculateFinalScore(board)
+        self.stats.addLeaves(1, time.perf_counter() - startTime)
+        return score
+
+    # leaf evaluation through the precomputed line tables in heuristics.py; equal to
+    # referenceFinalScore, the per-cell version of the same weighted formula
     def calculateFinalScore(self, board):
-        wSmooth = 1
-        wEmpty = 0.3       
-        wMerge = 0.001
-        wMono = 0.05
+        return self.evaluator.evaluate(board.state)
+
+    def referenceFinalScore(self, board):
+        wSmooth = self.weights['smooth']
+        wEmpty = self.weights['empty']
+        wMerge = self.weights['merge']
+        wMono = self.weights['mono']
         return (wSmooth * self.smoothness(board)        + \
                 wEmpty  * self.countEmptySquares(board) + \
                 wMerge  * self.getPotentialMerges(board)+ \
                 wMono   * self.monotonicity(board))
     
-    # s-heuristic idea adopted from: https://cs229.stanford.edu/proj2016/report/NieHouAn-AIPlays2048-report.pdf
-    # goal is a s-shaped board where high values are at top corners and tiles that can be merged are adjacent        
-    SNAKE_MATRIX = [[4**15, 4**14, 4**13, 4**12],
-                    [4**8,  4**9,  4**10, 4**11],
-                    [4**7,  4**6,  4**5,  4**4],
-                    [4**0,  4**1,  4**2,  4**3]]
-    
-    GRADIENT_MATRIX = [[4**6, 4**5, 4**4, 4**3],
-                       [4**5, 4**4, 4**3, 4**2],
-                       [4**4, 4**3, 4**2, 4**1],
-                       [4**3, 4**2, 4**1, 4**0]]
+    SNAKE_MATRIX = heuristics.SNAKE_MATRIX
+    GRADIENT_MATRIX = heuristics.GRADIENT_MATRIX
+
     # score of game state = dot product of game state (represented as 2D matrix) and weight matrix
     def smoothness(self, board):
+        snakeMatrix = heuristics.getSnakeMatrix(len(board.getBoard()))
         totalScore = 0
         for row in range(len(board.getBoard())):
             for col in range(len(board.getBoard())):
-                totalScore += board.getBoard(row, col) * self.SNAKE_MATRIX[row][col]
+                totalScore += board.getBoard(row, col) * snakeMatrix[row][col]
         return totalScore
 
     # allowing the board to have more tiles that are potential merges reduces uncertainty and increases value
@@ -135,17 +716,17 @@ class AISolver:
         horizCnt = 0
         for r in range(len(board.getBoard())):
             for c in range(len(board.getBoard())-1):
-                if board.getBoard(r, c) == board.getBoard(r, c+1):
-                    horizCnt *= 2
+                if board.getBoard(r, c) and board.getBoard(r, c) == board.getBoard(r, c+1):
+                    horizCnt += 1
         vertCnt = 0
         for c in range(len(board.getBoard())):
             col = [board.getBoard(r, c) for r in range(len(board.getBoard()))]
             for r in range(len(col)-1):
-                if board.getBoard(r, c) == board.getBoard(r+1, c):
-                    vertCnt *= 2
+                if board.getBoard(r, c) and board.getBoard(r, c) == board.getBoard(r+1, c):
+                    vertCnt += 1
         
-        wHoriz = 1
-        wVert = 0.6
+        wHoriz = self.weights['horizMerge']
+        wVert = self.weights['vertMerge']
         return wHoriz * horizCnt + wVert * vertCnt        
     
     def countEmptySquares(self, board):
@@ -172,7 +753,7 @@ class AISolver:
         colScores = []
         monotonicCols = 0
         for j in range(len(board.getBoard(0))):
-            col = [self.board.getBoard(i, j) for i in range(len(board.getBoard()))]
+            col = [board.getBoard(i, j) for i in range(len(board.getBoard()))]
             col_score = self.rowMonotonicity(col)
             colScores.append(col_score)
             if all(col[i] >= col[i + 1] for i in range(len(col) - 1)):
@@ -191,4 +772,43 @@ class AISolver:
                 score += diff
             elif diff < 0:
                 score -= diff
-        return score
\ No newline at end of file
+        return score
+
+#=================================================================================================
+# Worker-process side of the parallel search: each worker keeps one solver (and its
+# transposition table) alive for the lifetime of the pool.
+#=================================================================================================
+
+# everything besides the position that a cached value depends on; tables that outlive the solver
+# (transposition.MappedTable) are tagged with it so values from other settings are never reused
+def getTableFingerprint(weights=None, probCutoff=0, sampleCells=None, size=bitboard.SIZE):
+    return json.dumps({'weights': heuristics.getWeights(weights),
+                       'probCutoff': probCutoff,
+                       'sampleCells': sampleCells,
+                       'size': size}, sort_keys=True)
+
+workerSolver = None
+
+def initWorker(options):
+    global workerSolver
+    sharedTable = options.pop('sharedTable', None)
+    if sharedTable is not None:
+        name, slots = sharedTable
+        options['table'] = SharedTable(slots, name=name)
+    workerSolver = AISolver(None, **options)
+
+def workerCalculateScore(task):
+    state, size, move = task
+    workerSolver.useSize(size)
+    return workerSolver.calculateScore(Board.fromState(state, size=size), move)
+
+def workerCalculateBranchScore(task):
+    state, size, probability = task
+    workerSolver.useSize(size)
+    return workerSolver.calculateMoveScore(Board.fromState(state, size=size), 0, workerSolver.maxDepth,
+                                           probability)
+
+def workerRunPlayouts(task):
+    state, size, moves, count, seed, deadline, roundSize = task
+    timeLimit = None if deadline is None else max(0, deadline - time.time())
+    return workerSolver.runPlayouts(state, size, moves, count, random.Random(seed), timeLimit, roundSize)
@@ -0,0 +1,69 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from board import Board
+from ai import SearchTimeout
+
+#=================================================================================================
+# Runs AISolver.getNextMove on a background thread so the UI keeps drawing and taking input
+# while a move is being searched. The UI calls request() with the current board and poll() every
+# step; the search works on a snapshot of the board, so the UI is free to touch the real one.
+# Every request gets its own cancel token (a threading.Event handed to getNextMove): cancel() sets
+# it, which stops the running search at its next node or keeps a still-queued one from ever
+# starting, and bumps the generation, so a result that was started before a Restart/Home is
+# thrown away instead of being played on the new board.
+#=================================================================================================
+
+class AsyncSolver:
+    def __init__(self, solver):
+        self.solver = solver
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.future = None
+        self.generation = 0
+        self.requestGeneration = None
+        self.requestState = None
+        self.cancelToken = None
+
+    def isSearching(self):
+        return self.future is not None
+
+    # starts a search for board's next move unless one is already running
+    def request(self, board):
+        if self.future is not None:
+            return
+        snapshot = Board.fromState(board.state, board.score, size=board.size)
+        self.requestGeneration = self.generation
+        self.requestState = board.state
+        self.cancelToken = threading.Event()
+        self.future = self.executor.submit(self.search, self.solver, snapshot, self.cancelToken)
+
+    def search(self, solver, board, cancelToken):
+        if cancelToken.is_set():
+            return None
+        try:
+            return solver.getNextMove(board, cancelToken)
+        except SearchTimeout:
+            return None
+
+    # returns (True, move) once the search for board has finished, (False, None) while it runs;
+    # results from a cancelled search or for a different position are dropped
+    def poll(self, board):
+        if self.future is None or not self.future.done():
+            return (False, None)
+        future, self.future = self.future, None
+        if self.requestGeneration != self.generation or self.requestState != board.state:
+            return (False, None)
+        return (True, future.result())
+
+    # abandons the in-flight search; a new solver (e.g. after Restart) can be swapped in
+    def cancel(self, solver=None):
+        self.generation += 1
+        if self.future is not None:
+            self.cancelToken.set()
+            self.future.cancel()
+            self.future = None
+        if solver is not None:
+            self.solver = solver
+
+    def shutdown(self):
+        self.cancel()
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,160 @@
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+from board import Board
+from ai import AISolver
+from npboard import BatchBoard
+
+#=================================================================================================
+# Benchmark suite: times Board.performMove, Board.getAvailableMoves, Board.gameOver and
+# AISolver.getNextMove on a fixed corpus of positions, plus solver nodes/sec at each search depth
+# and the moves/sec of random play on a BatchBoard of copies of each position.
+# Results are written as JSON so runs can be compared between commits; with --baseline, any
+# throughput drop past --threshold against the baseline file fails the run (exit code 1).
+# Example: python benchmark.py --output new.json --baseline old.json --threshold 0.1
+#=================================================================================================
+
+# fixed positions taken from a seeded self-play game
+FIXTURES = {'early': [[16, 0, 0, 2],
+                      [4, 0, 0, 0],
+                      [0, 0, 0, 0],
+                      [0, 0, 2, 0]],
+            'mid': [[512, 128, 8, 2],
+                    [4, 2, 2, 16],
+                    [2, 0, 4, 2],
+                    [0, 0, 0, 2]],
+            'late': [[1024, 512, 128, 32],
+                     [16, 16, 32, 16],
+                     [2, 2, 2, 0],
+                     [0, 0, 2, 0]],
+            'nearlyFull': [[1024, 512, 256, 128],
+                           [2, 4, 16, 64],
+                           [0, 4, 16, 2],
+                           [0, 2, 2, 4]]}
+
+def percentile(sortedValues, p):
+    rank = max(0, min(len(sortedValues) - 1, round(p / 100 * len(sortedValues) + 0.5) - 1))
+    return sortedValues[rank]
+
+def summarize(latencies, extra=None):
+    latencies = sorted(latencies)
+    total = sum(latencies)
+    result = {'calls': len(latencies),
+              'opsPerSecond': round(len(latencies) / total, 2) if total > 0 else 0,
+              'latencyMicroseconds': {f'p{p}': round(percentile(latencies, p) * 1e6, 3)
+                                      for p in (50, 90, 99)}}
+    if extra:
+        result.update(extra)
+    return result
+
+# times fn(arg) once per prepared argument, so setup (copies, fresh solvers) stays off the clock;
+# one untimed call first keeps lazy table building and cold caches out of the numbers
+def timeCalls(fn, args, warmup=None):
+    if warmup is not None:
+        warmup()
+    latencies = []
+    for arg in args:
+        startTime = time.perf_counter()
+        fn(arg)
+        latencies.append(time.perf_counter() - startTime)
+    return latencies
+
+def benchmarkBoard(name, grid, calls):
+    state = Board(grid).state
+    results = {}
+    random.seed(0)
+    boards = [Board.fromState(state, seed=i) for i in range(calls)]
+    moves = [random.choice(Board.fromState(state).getAvailableMoves()) for i in range(calls)]
+    latencies = timeCalls(lambda i: boards[i].performMove(moves[i]), range(calls))
+    results[f'Board.performMove/{name}'] = summarize(latencies)
+    # Board caches its legal moves per state, so each query gets a fresh board to time the real work
+    boards = [Board.fromState(state) for i in range(calls)]
+    latencies = timeCalls(lambda i: boards[i].getAvailableMoves(), range(calls))
+    results[f'Board.getAvailableMoves/{name}'] = summarize(latencies)
+    boards = [Board.fromState(state) for i in range(calls)]
+    latencies = timeCalls(lambda i: boards[i].gameOver(), range(calls))
+    results[f'Board.gameOver/{name}'] = summarize(latencies)
+    return results
+
+# every call uses a fresh solver, so the transposition table never carries over between calls;
+# node counts come from the solver's own instrumentation (chance, max and leaf nodes)
+def benchmarkSolver(name, grid, depth, calls):
+    state = Board(grid).state
+    solvers = [AISolver(None, maxDepth=depth, instrument=True) for i in range(calls)]
+    board = Board.fromState(state)
+    latencies = timeCalls(lambda solver: solver.getNextMove(board), solvers,
+                          lambda: AISolver(None, maxDepth=depth).getNextMove(board))
+    nodes = sum(solver.lastStats.getTotalNodes() for solver in solvers)
+    seconds = sum(latencies)
+    return {f'AISolver.getNextMove/depth{depth}/{name}':
+            summarize(latencies, {'nodes': nodes,
+                                  'nodesPerSecond': round(nodes / seconds, 2) if seconds > 0 else 0})}
+
+# calls lockstep steps of random legal moves over `games` copies of the position
+def benchmarkBatch(name, grid, games, calls):
+    batch = BatchBoard(states=[Board(grid).state] * games, seed=0)
+    movesBefore = int(batch.moves.sum())
+    latencies = timeCalls(lambda i: batch.performMoves(batch.getRandomMoves()), range(calls))
+    moves = int(batch.moves.sum()) - movesBefore
+    seconds = sum(latencies)
+    return {f'BatchBoard.performMoves/{name}':
+            summarize(latencies, {'games': games,
+                                  'movesPerSecond': round(moves / seconds, 2) if seconds > 0 else 0})}
+
+def runBenchmarks(boardCalls=2000, solverCalls=3, depths=(1, 2, 3), batchGames=4096):
+    results = {}
+    for name, grid in FIXTURES.items():
+        results.update(benchmarkBoard(name, grid, boardCalls))
+        results.update(benchmarkBatch(name, grid, batchGames, boardCalls // 20))
+        for depth in depths:
+            results.update(benchmarkSolver(name, grid, depth, solverCalls))
+    return {'meta': {'python': platform.python_version(),
+                     'platform': platform.platform(),
+                     'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S')},
+            'results': results}
+
+# throughput metrics that may not drop; returns a list of (benchmark, metric, old, new) regressions
+def findRegressions(baseline, current, threshold):
+    regressions = []
+    for name, old in baseline['results'].items():
+        new = current['results'].get(name)
+        if new is None:
+            continue
+        for metric in ('opsPerSecond', 'nodesPerSecond', 'movesPerSecond'):
+            if metric in old and metric in new and new[metric] < old[metric] * (1 - threshold):
+                regressions.append((name, metric, old[metric], new[metric]))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark Board and AISolver on fixed positions.')
+    parser.add_argument('--output', default='-', help="results file ('-' for stdout)")
+    parser.add_argument('--baseline', default=None, help='results file of an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='allowed throughput drop against the baseline (0.1 = 10%%)')
+    parser.add_argument('--board-calls', type=int, default=2000, help='timed calls per Board benchmark')
+    parser.add_argument('--solver-calls', type=int, default=3, help='timed calls per solver benchmark')
+    parser.add_argument('--depths', type=int, nargs='+', default=[1, 2, 3], help='solver depths to time')
+    parser.add_argument('--batch-games', type=int, default=4096, help='games per BatchBoard benchmark')
+    args = parser.parse_args(argv)
+
+    current = runBenchmarks(args.board_calls, args.solver_calls, args.depths, args.batch_games)
+    if args.output == '-':
+        print(json.dumps(current, indent=2))
+    else:
+        with open(args.output, 'w') as out:
+            json.dump(current, out, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = findRegressions(baseline, current, args.threshold)
+        for name, metric, old, new in regressions:
+            print(f'REGRESSION {name} {metric}: {old} -> {new}', file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
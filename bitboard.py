@@ -0,0 +1,328 @@
+import sys
+
+#=================================================================================================
+# Compact 4x4 engine: the whole board is packed into one 64-bit integer as 16 four-bit tile
+# exponents (0 = empty, 1 = 2, 2 = 4, ..., 15 = 32768).
+# - cell (row, col) lives in the nibble at bit offset 4*(4*row + col), so every row is a 16-bit
+#   chunk with col 0 in its lowest nibble
+# - left/right moves are looked up row by row from precomputed 65536-entry tables
+# - up/down moves transpose the board, move left/right and transpose back
+# Table-driven moves adopted from: https://github.com/nneonneo/2048-ai
+# Other board sizes (3x3 through 8x8) use a PackedEngine from getEngine(size), which has the same
+# functions as this module; this module itself is the engine for size 4.
+#=================================================================================================
+
+SIZE = 4
+ROW_MASK = 0xFFFF
+MAX_EXPONENT = 15
+DIRECTIONS = ['left', 'right', 'up', 'down']
+
+def tileToExponent(value):
+    exponent = 0
+    while value > 1:
+        value >>= 1
+        exponent += 1
+    return exponent
+
+def exponentToTile(exponent):
+    return 1 << exponent if exponent else 0
+
+def encodeBoard(grid):
+    state = 0
+    for row in range(SIZE):
+        for col in range(SIZE):
+            state |= tileToExponent(grid[row][col]) << (4 * (SIZE*row + col))
+    return state
+
+def decodeBoard(state):
+    return [[exponentToTile((state >> (4 * (SIZE*row + col))) & 0xF) for col in range(SIZE)]
+            for row in range(SIZE)]
+
+def getExponent(state, row, col):
+    return (state >> (4 * (SIZE*row + col))) & 0xF
+
+def getTile(state, row, col):
+    return exponentToTile(getExponent(state, row, col))
+
+def setTile(state, row, col, value):
+    shift = 4 * (SIZE*row + col)
+    return (state & ~(0xF << shift)) | (tileToExponent(value) << shift)
+
+def getRow(state, row):
+    return (state >> (16 * row)) & ROW_MASK
+
+# swap rows and columns with three masked nibble moves and three masked byte moves
+def transpose(state):
+    a1 = state & 0xF0F00F0FF0F00F0F
+    a2 = state & 0x0000F0F00000F0F0
+    a3 = state & 0x0F0F00000F0F0000
+    a = a1 | (a2 << 12) | (a3 >> 12)
+    b1 = a & 0xFF00FF0000FF00FF
+    b2 = a & 0x00FF00FF00000000
+    b3 = a & 0x00000000FF00FF00
+    return b1 | (b2 >> 24) | (b3 << 24)
+
+def reverseRow(row):
+    return ((row & 0xF) << 12) | ((row & 0xF0) << 4) | ((row >> 4) & 0xF0) | (row >> 12)
+
+def unpackRow(row):
+    return [(row >> (4*i)) & 0xF for i in range(SIZE)]
+
+def packRow(line):
+    row = 0
+    for i in range(SIZE):
+        row |= line[i] << (4*i)
+    return row
+
+# slide one line of exponents towards index 0, merging each pair at most once
+# two tiles of maxExponent are left unmerged since the next tile would not fit in a cell
+def slideLine(line, maxExponent=MAX_EXPONENT):
+    tiles = [exp for exp in line if exp]
+    merged = []
+    points = 0
+    i = 0
+    while i < len(tiles):
+        if i+1 < len(tiles) and tiles[i] == tiles[i+1] and tiles[i] < maxExponent:
+            merged.append(tiles[i] + 1)
+            points += 1 << (tiles[i] + 1)
+            i += 2
+        else:
+            merged.append(tiles[i])
+            i += 1
+    return merged + [0] * (len(line) - len(merged)), points
+
+def buildRowTables():
+    leftTable = [0] * (ROW_MASK + 1)
+    rightTable = [0] * (ROW_MASK + 1)
+    leftScores = [0] * (ROW_MASK + 1)
+    rightScores = [0] * (ROW_MASK + 1)
+    for row in range(ROW_MASK + 1):
+        line = unpackRow(row)
+        merged, points = slideLine(line)
+        leftTable[row] = packRow(merged)
+        leftScores[row] = points
+        merged, points = slideLine(line[::-1])
+        rightTable[row] = packRow(merged[::-1])
+        rightScores[row] = points
+    return leftTable, rightTable, leftScores, rightScores
+
+LEFT_TABLE, RIGHT_TABLE, LEFT_SCORES, RIGHT_SCORES = buildRowTables()
+
+def moveRows(state, table, scores):
+    r0 = state & ROW_MASK
+    r1 = (state >> 16) & ROW_MASK
+    r2 = (state >> 32) & ROW_MASK
+    r3 = state >> 48
+    newState = table[r0] | (table[r1] << 16) | (table[r2] << 32) | (table[r3] << 48)
+    return newState, scores[r0] + scores[r1] + scores[r2] + scores[r3]
+
+# returns (new state, points gained); an unknown direction leaves the board untouched
+def executeMove(state, direction):
+    if direction == 'left':
+        return moveRows(state, LEFT_TABLE, LEFT_SCORES)
+    elif direction == 'right':
+        return moveRows(state, RIGHT_TABLE, RIGHT_SCORES)
+    elif direction == 'up':
+        newState, points = moveRows(transpose(state), LEFT_TABLE, LEFT_SCORES)
+        return transpose(newState), points
+    elif direction == 'down':
+        newState, points = moveRows(transpose(state), RIGHT_TABLE, RIGHT_SCORES)
+        return transpose(newState), points
+    return state, 0
+
+def getEmptyCells(state):
+    emptyCells = []
+    for i in range(SIZE*SIZE):
+        if not (state >> (4*i)) & 0xF:
+            emptyCells.append((i // SIZE, i % SIZE))
+    return emptyCells
+
+# fold every nibble onto its lowest bit, then count the nibbles that stayed zero
+def countEmpty(state):
+    state |= state >> 2
+    state |= state >> 1
+    return (~state & 0x1111111111111111).bit_count()
+
+def getMaxExponent(state):
+    best = 0
+    while state:
+        best = max(best, state & 0xF)
+        state >>= 4
+    return best
+
+def hasExponent(state, exponent):
+    for i in range(SIZE*SIZE):
+        if (state >> (4*i)) & 0xF == exponent:
+            return True
+    return False
+
+def getAvailableMoves(state):
+    available = []
+    for move in DIRECTIONS:
+        if executeMove(state, move)[0] != state:
+            available.append(move)
+    return available
+
+#=================================================================================================
+# Size-generic engine: an N x N board (MIN_SIZE <= N <= MAX_SIZE) packed into one arbitrary-width
+# integer, row-major with BITS bits per cell exponent (4 bits up to 4x4, 5 bits for larger boards,
+# since tiles past 32768 are reachable there). Rows are N*BITS-bit chunks, so moves still go row by
+# row through move tables; a table over every possible row would be too large past 4x4, so each
+# row is slid once on first use and cached (up to MAX_CACHED_ROWS rows, then the cache starts
+# over, so long games and deep searches don't grow it without bound). Columns are gathered into the same row layout for
+# up/down. Every operation costs O(N*N) at most, with no nested lists involved.
+#=================================================================================================
+
+MIN_SIZE = 3
+MAX_SIZE = 8
+MAX_CACHED_ROWS = 1 << 16 # as many rows as the full 4x4 tables hold
+
+class PackedEngine:
+    def __init__(self, size):
+        self.SIZE = size
+        self.BITS = 4 if size <= 4 else 5
+        self.CELL_MASK = (1 << self.BITS) - 1
+        self.MAX_EXPONENT = self.CELL_MASK
+        self.ROW_BITS = size * self.BITS
+        self.ROW_MASK = (1 << self.ROW_BITS) - 1
+        self.DIRECTIONS = DIRECTIONS
+        self.rowMoves = {} # row -> (left row, left points, right row, right points)
+
+    def tileToExponent(self, value):
+        return tileToExponent(value)
+
+    def exponentToTile(self, exponent):
+        return exponentToTile(exponent)
+
+    def encodeBoard(self, grid):
+        state = 0
+        for row in range(self.SIZE):
+            for col in range(self.SIZE):
+                state |= tileToExponent(grid[row][col]) << (self.BITS * (self.SIZE*row + col))
+        return state
+
+    def decodeBoard(self, state):
+        return [[exponentToTile(exponent) for exponent in self.unpackRow(row)]
+                for row in self.getRows(state)]
+
+    def getExponent(self, state, row, col):
+        return (state >> (self.BITS * (self.SIZE*row + col))) & self.CELL_MASK
+
+    def getTile(self, state, row, col):
+        return exponentToTile(self.getExponent(state, row, col))
+
+    def setTile(self, state, row, col, value):
+        shift = self.BITS * (self.SIZE*row + col)
+        return (state & ~(self.CELL_MASK << shift)) | (tileToExponent(value) << shift)
+
+    def getRow(self, state, row):
+        return (state >> (self.ROW_BITS * row)) & self.ROW_MASK
+
+    def getRows(self, state):
+        return [(state >> (self.ROW_BITS * row)) & self.ROW_MASK for row in range(self.SIZE)]
+
+    def fromRows(self, rows):
+        state = 0
+        for row in reversed(rows):
+            state = (state << self.ROW_BITS) | row
+        return state
+
+    # column c as a row: cell (r, c) goes to position r
+    def getColumns(self, state):
+        bits = self.BITS
+        mask = self.CELL_MASK
+        columns = [0] * self.SIZE
+        for row in range(self.SIZE):
+            line = (state >> (self.ROW_BITS * row)) & self.ROW_MASK
+            for col in range(self.SIZE):
+                columns[col] |= ((line >> (bits*col)) & mask) << (bits*row)
+        return columns
+
+    def transpose(self, state):
+        return self.fromRows(self.getColumns(state))
+
+    def unpackRow(self, row):
+        return [(row >> (self.BITS*i)) & self.CELL_MASK for i in range(self.SIZE)]
+
+    def packRow(self, line):
+        row = 0
+        for i in range(self.SIZE):
+            row |= line[i] << (self.BITS*i)
+        return row
+
+    def getRowMove(self, row):
+        move = self.rowMoves.get(row)
+        if move is None:
+            line = self.unpackRow(row)
+            left, leftPoints = slideLine(line, self.MAX_EXPONENT)
+            right, rightPoints = slideLine(line[::-1], self.MAX_EXPONENT)
+            move = (self.packRow(left), leftPoints, self.packRow(right[::-1]), rightPoints)
+            if len(self.rowMoves) >= MAX_CACHED_ROWS:
+                self.rowMoves.clear()
+            self.rowMoves[row] = move
+        return move
+
+    def moveRows(self, rows, toRight):
+        newRows = []
+        points = 0
+        for row in rows:
+            move = self.getRowMove(row)
+            if toRight:
+                newRows.append(move[2])
+                points += move[3]
+            else:
+                newRows.append(move[0])
+                points += move[1]
+        return newRows, points
+
+    # returns (new state, points gained); an unknown direction leaves the board untouched
+    def executeMove(self, state, direction):
+        if direction == 'left' or direction == 'right':
+            newRows, points = self.moveRows(self.getRows(state), direction == 'right')
+            return self.fromRows(newRows), points
+        elif direction == 'up' or direction == 'down':
+            newColumns, points = self.moveRows(self.getColumns(state), direction == 'down')
+            return self.transpose(self.fromRows(newColumns)), points
+        return state, 0
+
+    def getEmptyCells(self, state):
+        emptyCells = []
+        for i in range(self.SIZE*self.SIZE):
+            if not (state >> (self.BITS*i)) & self.CELL_MASK:
+                emptyCells.append((i // self.SIZE, i % self.SIZE))
+        return emptyCells
+
+    def countEmpty(self, state):
+        return sum(1 for i in range(self.SIZE*self.SIZE) if not (state >> (self.BITS*i)) & self.CELL_MASK)
+
+    def getMaxExponent(self, state):
+        best = 0
+        while state:
+            best = max(best, state & self.CELL_MASK)
+            state >>= self.BITS
+        return best
+
+    def hasExponent(self, state, exponent):
+        for i in range(self.SIZE*self.SIZE):
+            if (state >> (self.BITS*i)) & self.CELL_MASK == exponent:
+                return True
+        return False
+
+    def getAvailableMoves(self, state):
+        available = []
+        for move in DIRECTIONS:
+            if self.executeMove(state, move)[0] != state:
+                available.append(move)
+        return available
+
+engines = {}
+
+# the engine for size x size boards: this module for 4x4, a shared PackedEngine otherwise
+def getEngine(size=SIZE):
+    if size == SIZE:
+        return sys.modules[__name__]
+    if not MIN_SIZE <= size <= MAX_SIZE:
+        raise ValueError(f'board size must be between {MIN_SIZE} and {MAX_SIZE}, got {size}')
+    if size not in engines:
+        engines[size] = PackedEngine(size)
+    return engines[size]
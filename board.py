@@ -1,36 +1,96 @@
 import random
 import copy
-
+import bitboard
+
+#=================================================================================================
+# Spawn streams: an object with nextSpawn(emptyTiles) -> ((row, col), value) can be passed to a
+# Board to decide where tiles appear instead of the board's own RNG.
+# - SpawnStream draws exactly two uniform numbers per spawn (cell, then 2-or-4), so two games
+#   with the same seed get the same random numbers at every spawn even once their boards differ;
+#   this is what lets two solvers be compared on common random numbers
+# - FixedSpawns replays a given list of spawns, e.g. one taken from a game record
+#=================================================================================================
+
+class SpawnStream:
+    def __init__(self, seed=None):
+        self.rng = random.Random(seed)
+
+    def nextSpawn(self, emptyTiles):
+        cell = emptyTiles[int(self.rng.random() * len(emptyTiles))]
+        value = 2 if self.rng.random() < 0.9 else 4
+        return (cell, value)
+
+class FixedSpawns:
+    def __init__(self, spawns):
+        self.spawns = iter(spawns)
+
+    def nextSpawn(self, emptyTiles):
+        spawn = next(self.spawns, None)
+        if spawn is None:
+            raise ValueError('spawn stream is exhausted')
+        location, value = spawn
+        if tuple(location) not in emptyTiles:
+            raise ValueError(f'cannot spawn at {location}: the cell is not empty')
+        return (tuple(location), value)
+
+# the grid is kept as a packed integer (see bitboard.py); getBoard() decodes it on demand.
+# size picks the board dimensions (3 to 8, default 4, or the size of the given grid); every
+# board operation goes through the packed engine for that size.
+# Every board has its own RNG (seeded with `seed`, or from the OS when None) unless a spawn stream
+# is given, so games never share random state and a seed always reproduces the same game. The RNG
+# is only created at the first random spawn, which keeps fromState boards cheap.
 class Board:    
     highScore = 0
 
-    def __init__(self, board=False, addTiles=False):        
+    def __init__(self, board=False, addTiles=False, seed=None, spawns=None, size=None):
+        self.size = len(board) if board else (size or bitboard.SIZE)
+        self.engine = bitboard.getEngine(self.size)
+        self.seed = seed
+        self.rng = None
+        self.spawns = spawns
         if not board:
-            self.board = [[0] * 4 for i in range(4)]     
+            self.state = 0
         else:
-            self.board = board
+            self.state = self.engine.encodeBoard(board)
+        self.grid = None
+        self.gridState = None
+        self.emptyTilesCache = (None, None)
+        self.legalMovesCache = (None, None)
+        self.maxTileCache = (None, None)
+        self.winCache = (None, None)
         if addTiles:
             self.addTile()
             self.addTile()
         self.score = 0
 
+    @classmethod
+    def fromState(cls, state, score=0, seed=None, spawns=None, size=None):
+        board = cls(seed=seed, spawns=spawns, size=size)
+        board.state = state
+        board.score = score
+        return board
+
+    # the decoded grid is cached until the packed state changes, so repeated lookups stay cheap
     def getBoard(self, row=-1, col=-1):
+        if self.gridState != self.state:
+            self.grid = self.engine.decodeBoard(self.state)
+            self.gridState = self.state
         if row == -1 and col == -1:
-            return self.board
+            return self.grid
         elif col == -1:
-            return self.board[row]
+            return self.grid[row]
         elif row == -1:
-            return [self.board[row][col] for row in range(len(self.board))]
+            return [self.grid[row][col] for row in range(self.size)]
         else:
-            return self.board[row][col]
+            return self.grid[row][col]
 
-    def getEmptyTiles(self):        
-        emptyTiles = []
-        for r in range(len(self.board)):
-            for c in range(len(self.board)):
-                if self.board[r][c] == 0:
-                    emptyTiles.append((r, c))
-        return emptyTiles
+    # derived state (empty cells, max tile, 2048 reached, legal moves) is computed on first query
+    # and cached as (state, value) until the packed state changes, so a move only pays for what is
+    # asked about the new position; boards copied for search keep their own caches
+    def getEmptyTiles(self):
+        if self.emptyTilesCache[0] != self.state:
+            self.emptyTilesCache = (self.state, self.engine.getEmptyCells(self.state))
+        return list(self.emptyTilesCache[1])
 
     def getScore(self):
         return self.score
@@ -42,39 +102,36 @@ class Board:
         return Board.highScore
 
     def getAvailableMoves(self):
-        available = []
-        for move in ['left', 'right', 'up', 'down']:
-            boardCopy = copy.deepcopy(self)   
-            newBoard = boardCopy.performMove(move)
-            if self.board != newBoard:
-                available.append(move)
-        return available
+        return list(self.getLegalMoves())
+
+    # the cached legal moves themselves, for internal queries that don't hand the list out
+    def getLegalMoves(self):
+        if self.legalMovesCache[0] != self.state:
+            self.legalMovesCache = (self.state, self.engine.getAvailableMoves(self.state))
+        return self.legalMovesCache[1]
 
     def addTile(self, location=None, value=None):
         emptyTiles = self.getEmptyTiles()
         if not emptyTiles:
             return []
-        pos = random.choice(emptyTiles)
-        emptyRow, emptyCol = pos[0], pos[1]
         
-        if value:
-            if location:
-                (row, col) = location
-                self.board[row][col] = value
-            else:
-                self.board[emptyRow][emptyCol] = value
-        else: # P(tile 2)=0.9 and P(tile 4)=0.1         
-            val = 0
-            if random.random() < 0.9:
-                val = 2
-            else:
-                val = 4
-            self.board[emptyRow][emptyCol] = val
+        if value and location:
+            (row, col) = location
+        elif self.spawns is not None:
+            (row, col), spawnValue = self.spawns.nextSpawn(emptyTiles)
+            value = value or spawnValue
+        else:
+            if self.rng is None:
+                self.rng = random.Random(self.seed)
+            (row, col) = self.rng.choice(emptyTiles)
+            if not value: # P(tile 2)=0.9 and P(tile 4)=0.1
+                value = 2 if self.rng.random() < 0.9 else 4
+        self.state = self.engine.setTile(self.state, row, col, value)
 
     # print the board on the terminal for efficient testing
     def __str__(self):
         output = ''
-        for r in self.board:
+        for r in self.getBoard():
             # note: join() only works for list of strings
             # use 'x' as placeholder for 0 for better readability
             output += '\t'.join([str(val) if val > 0 else 'x' for val in r])
@@ -82,117 +139,56 @@ class Board:
         output += '\n' + f'Score: {self.score}' + '\n'
         if self.gameOver():
             output += 'GAME OVER'
-        if self.win():
+        if self.winGame():
             output += 'YOU WON!'
         return output
     
-    def moveLeft(self):
-        newScores = []
-        for r in range(len(self.board)):
-            for c in range(len(self.board)-1):
-                self.shiftLeft(r)
-                curVal = self.board[r][c]
-                nextVal = self.board[r][c+1]
-                if curVal == nextVal:
-                    self.board[r][c] *= 2
-                    self.board[r][c+1] = 0
-                    newScores.append(self.board[r][c])
-            self.shiftLeft(r)
-        return self.board, newScores
-
-    def shiftLeft(self, r):
-        curRow = self.board[r]
-        self.board[r] = [val for val in curRow if val != 0] + [0]*curRow.count(0)         
-    
-    def moveRight(self):
-        newScores = []
-        for r in range(len(self.board)):
-            for c in range(len(self.board)-1, 0, -1):
-                self.shiftRight(r)
-                curVal = self.board[r][c]
-                nextVal = self.board[r][c-1]
-                if curVal == nextVal:
-                    self.board[r][c] *= 2
-                    self.board[r][c-1] = 0
-                    newScores.append(self.board[r][c])
-            self.shiftRight(r)
-        return self.board, newScores
-
-    def shiftRight(self, r):
-        curRow = self.board[r]
-        self.board[r] = [0]*curRow.count(0) + [val for val in curRow if val != 0]        
-
-    def moveUp(self):
-        newScores = []
-        for c in range(len(self.board)):
-            for r in range(len(self.board)-1):
-                self.shiftUp(c)
-                curVal = self.board[r][c]
-                nextVal = self.board[r+1][c]
-                if curVal == nextVal:
-                    self.board[r][c] *= 2
-                    self.board[r+1][c] = 0
-                    newScores.append(self.board[r][c])
-            self.shiftUp(c)
-        return self.board, newScores
-
-    def shiftUp(self, c):
-        curCol = [self.board[r][c] for r in range(len(self.board))]
-        newCol = [val for val in curCol if val != 0] + [0]*curCol.count(0)
-        for r in range(len(self.board)):
-            self.board[r][c] = newCol[r]
-
-    def moveDown(self):
-        newScores = []
-        for c in range(len(self.board)):
-            for r in range(len(self.board)-1, 0, -1):
-                self.shiftDown(c)
-                curVal = self.board[r][c]
-                nextVal = self.board[r-1][c]
-                if curVal == nextVal:
-                    self.board[r][c] *= 2
-                    self.board[r-1][c] = 0
-                    newScores.append(self.board[r][c])
-            self.shiftDown(c)
-        return self.board, newScores
-
-    def shiftDown(self, c):
-        curCol = [self.board[r][c] for r in range(len(self.board))]
-        newCol = [0]*curCol.count(0) + [val for val in curCol if val != 0]
-        for r in range(len(self.board)):
-            self.board[r][c] = newCol[r]
-
-    def performMove(self, direction):             
-        originalState = copy.deepcopy(self.board)
-
-        if direction == 'up':      
-            _, newScores = self.moveUp()
-        elif direction == 'down':
-            _, newScores = self.moveDown()
-        elif direction == 'left':
-            _, newScores = self.moveLeft()
-        elif direction == 'right':
-            _, newScores = self.moveRight()
-
-        if self.board != originalState:
-            self.score += sum(newScores)
+    def performMove(self, direction):
+        newState, points = self.engine.executeMove(self.state, direction)
+        if newState != self.state:
+            self.state = newState
+            self.score += points
             self.addTile()
-        return self.board
+        return self.getBoard()
+
+    # side-effect-free move for search: returns (new board, points gained, changed flag)
+    # without spawning a tile, touching the RNG or mutating self
+    def getAfterstate(self, direction):
+        newState, points = self.engine.executeMove(self.state, direction)
+        return self.derive(newState, self.score + points), points, newState != self.state
+
+    # side-effect-free spawn for search: returns a new board with value placed at location
+    def withTile(self, location, value):
+        return self.derive(self.engine.setTile(self.state, location[0], location[1], value), self.score)
+
+    # a search board of the same class and size at state; it gets no RNG, seed or spawn stream of
+    # its own, so nothing done to it can draw from this game's spawns
+    def derive(self, state, score):
+        newBoard = copy.copy(self)
+        newBoard.state = state
+        newBoard.score = score
+        newBoard.seed = None
+        newBoard.rng = None
+        newBoard.spawns = None
+        return newBoard
+
+    def getMaxTile(self):
+        if self.maxTileCache[0] != self.state:
+            self.maxTileCache = (self.state, bitboard.exponentToTile(self.engine.getMaxExponent(self.state)))
+        return self.maxTileCache[1]
 
     def winGame(self):        
-        for r in range(len(self.board)):
-            for c in range(len(self.board)):
-                if self.board[r][c] == 2048:
-                    return True
-        return False
+        if self.winCache[0] != self.state:
+            self.winCache = (self.state, self.engine.hasExponent(self.state, bitboard.tileToExponent(2048)))
+        return self.winCache[1]
 
     def gameOver(self):        
-        return not self.getAvailableMoves()
+        return not self.getLegalMoves()
 
 class mtpBoard1(Board):
     highScore = 0
-    def __init__(self, board=False, addTiles=False):
-        super().__init__(board, addTiles)
+    def __init__(self, board=False, addTiles=False, seed=None, spawns=None, size=None):
+        super().__init__(board, addTiles, seed, spawns, size)
     
     def getHighScore(self):        
         if self.score > mtpBoard1.highScore:
@@ -201,8 +197,8 @@ class mtpBoard1(Board):
 
 class mtpBoard2(Board):
     highScore = 0
-    def __init__(self, board=False, addTiles=False):
-        super().__init__(board, addTiles)
+    def __init__(self, board=False, addTiles=False, seed=None, spawns=None, size=None):
+        super().__init__(board, addTiles, seed, spawns, size)
     
     def getHighScore(self):        
         if self.score > mtpBoard2.highScore:
@@ -212,8 +208,8 @@ class mtpBoard2(Board):
 class aiBoard(Board):
     highScore = 0
 
-    def __init__(self, board=False, addTiles=False):
-        super().__init__(board, addTiles)
+    def __init__(self, board=False, addTiles=False, seed=None, spawns=None, size=None):
+        super().__init__(board, addTiles, seed, spawns, size)
     
     def getHighScore(self):
         if self.winGame() or self.gameOver():
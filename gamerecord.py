@@ -0,0 +1,165 @@
+import argparse
+import struct
+from board import Board
+import bitboard
+
+#=================================================================================================
+# Compact binary game records. A record file is the MAGIC header followed by games; a game is
+#   START, the initial packed board (8 bytes, little endian),
+#   two bytes per move: the direction index into bitboard.DIRECTIONS, then the spawn
+#                       (exponent << 4 | cell, or NO_SPAWN),
+#   END.
+# Move bytes never take the values of START/END, so a game ends at the first END byte and a game
+# cut short by a crash is still readable up to its last complete move. A typical 2048 game is a
+# few kilobytes. Replaying only needs the row tables, no search.
+# Example: python gamerecord.py games.rec --game 3 --move 120
+#=================================================================================================
+
+MAGIC = b'2048REC\x01'
+START = 0xFE
+END = 0xFF
+NO_SPAWN = 0xF0
+MAX_SPAWN_EXPONENT = 14 # keeps spawn bytes below NO_SPAWN
+
+# the cell that differs between a move's afterstate and the board after its spawn, as
+# ((row, col), value); (None, 0) when nothing spawned
+def findSpawn(afterstate, state):
+    for index in range(bitboard.SIZE * bitboard.SIZE):
+        if (afterstate >> (4*index)) & 0xF != (state >> (4*index)) & 0xF:
+            return (divmod(index, bitboard.SIZE), bitboard.exponentToTile((state >> (4*index)) & 0xF))
+    return (None, 0)
+
+def encodeSpawn(location, value):
+    if location is None:
+        return NO_SPAWN
+    exponent = bitboard.tileToExponent(value)
+    if not 0 < exponent <= MAX_SPAWN_EXPONENT:
+        raise ValueError(f'cannot record a spawned {value} tile')
+    return (exponent << 4) | (location[0] * bitboard.SIZE + location[1])
+
+def decodeSpawn(spawn):
+    if spawn == NO_SPAWN:
+        return (None, 0)
+    return (divmod(spawn & 0xF, bitboard.SIZE), bitboard.exponentToTile(spawn >> 4))
+
+# appends games to a binary file object as they are played; nothing is buffered beyond the file
+# object itself, so a long run can be interrupted without losing the finished games.
+# header=False writes bare games (e.g. into a BytesIO in a worker process) for appendGame.
+class RecordWriter:
+    def __init__(self, out, header=True):
+        self.out = out
+        self.inGame = False
+        if header and out.tell() == 0:
+            out.write(MAGIC)
+
+    def startGame(self, board):
+        if board.size != bitboard.SIZE:
+            raise ValueError('game records only hold 4x4 games')
+        if self.inGame:
+            self.endGame()
+        self.out.write(struct.pack('<BQ', START, board.state))
+        self.inGame = True
+
+    # previousState is the board before the move, state the board after the move and its spawn
+    def writeMove(self, direction, previousState, state):
+        afterstate, _ = bitboard.executeMove(previousState, direction)
+        location, value = findSpawn(afterstate, state)
+        self.out.write(bytes((bitboard.DIRECTIONS.index(direction), encodeSpawn(location, value))))
+
+    def endGame(self):
+        if self.inGame:
+            self.out.write(bytes((END,)))
+            self.out.flush()
+            self.inGame = False
+
+    # copies complete games written by another (header=False) writer
+    def appendGame(self, data):
+        self.out.write(data)
+        self.out.flush()
+
+class GameRecord:
+    def __init__(self, initialState, moveBytes, complete=True):
+        self.initialState = initialState
+        self.moveBytes = moveBytes
+        self.complete = complete
+
+    def __len__(self):
+        return len(self.moveBytes) // 2
+
+    # (direction, (row, col), value) per move, decoded on demand
+    def getMoves(self):
+        for i in range(0, len(self.moveBytes) - 1, 2):
+            location, value = decodeSpawn(self.moveBytes[i+1])
+            yield (bitboard.DIRECTIONS[self.moveBytes[i]], location, value)
+
+    # (state, score) after each of the first `moves` moves (all of them by default), starting
+    # with the initial position
+    def getPositions(self, moves=None):
+        state = self.initialState
+        score = 0
+        yield (state, score)
+        for i, (direction, location, value) in enumerate(self.getMoves()):
+            if moves is not None and i >= moves:
+                break
+            state, points = bitboard.executeMove(state, direction)
+            score += points
+            if location is not None:
+                state = bitboard.setTile(state, location[0], location[1], value)
+            yield (state, score)
+
+    # the Board after `moves` moves (the final position by default), rebuilt without any search
+    def replay(self, moves=None, boardClass=Board):
+        for state, score in self.getPositions(moves):
+            pass
+        return boardClass.fromState(state, score)
+
+# iterates the games of a binary file object one at a time, reading it in chunks
+def readRecords(f, chunkSize=1 << 16):
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError('not a game record file')
+    buffer = b''
+    pos = 0
+    eof = False
+    while True:
+        # the 8 state bytes can hold any value, so END is searched for after them
+        end = buffer.find(END, pos + 9) if len(buffer) - pos > 9 else -1
+        if end == -1 and not eof:
+            chunk = f.read(chunkSize)
+            eof = not chunk
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            continue
+        if pos == len(buffer):
+            return
+        if buffer[pos] != START:
+            raise ValueError(f'corrupt game record: expected a game start, got byte {buffer[pos]}')
+        initialState = struct.unpack_from('<Q', buffer, pos + 1)[0] if len(buffer) - pos >= 9 else None
+        if end == -1:
+            # truncated last game: keep its complete moves
+            if initialState is not None:
+                moveBytes = buffer[pos+9:]
+                yield GameRecord(initialState, moveBytes[:len(moveBytes)//2*2], False)
+            return
+        yield GameRecord(initialState, buffer[pos+9:end])
+        pos = end + 1
+
+def readRecord(path, game):
+    with open(path, 'rb') as f:
+        for i, record in enumerate(readRecords(f)):
+            if i == game:
+                return record
+    raise IndexError(f'{path} has no game {game}')
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay a position from a binary game record file.')
+    parser.add_argument('path', help='game record file')
+    parser.add_argument('--game', type=int, default=0, help='index of the game in the file')
+    parser.add_argument('--move', type=int, default=None, help='number of moves to replay (default: all)')
+    args = parser.parse_args(argv)
+
+    record = readRecord(args.path, args.game)
+    print(f'game {args.game}: {len(record)} moves' + ('' if record.complete else ' (truncated)'))
+    print(record.replay(args.move))
+
+if __name__ == '__main__':
+    main()
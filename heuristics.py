@@ -0,0 +1,189 @@
+import numpy as np
+import bitboard
+import npboard
+
+#=================================================================================================
+# Table-driven leaf evaluation for the packed board.
+# Every heuristic in AISolver.calculateFinalScore is a sum of per-line terms, so each term is
+# precomputed for all 65536 possible 4-tile lines:
+# - one weighted table per row index (snake dot product, row monotonicity, horizontal merges)
+# - one weighted table shared by the columns (column monotonicity, vertical merges)
+# - the empty-square bonus only depends on the total count of empty cells
+# A leaf evaluation is then eight table lookups (4 rows + 4 transposed columns) plus a sum, and
+# evaluateBatch does the same lookups for a whole NumPy array of leaves at once.
+#=================================================================================================
+
+# weights of calculateFinalScore; 'horizMerge'/'vertMerge' are the inner weights of getPotentialMerges
+DEFAULT_WEIGHTS = {'smooth': 1,
+                   'empty': 0.3,
+                   'merge': 0.001,
+                   'mono': 0.05,
+                   'horizMerge': 1,
+                   'vertMerge': 0.6}
+
+# s-heuristic idea adopted from: https://cs229.stanford.edu/proj2016/report/NieHouAn-AIPlays2048-report.pdf
+# goal is a s-shaped board where high values are at top corners and tiles that can be merged are adjacent
+SNAKE_MATRIX = [[4**15, 4**14, 4**13, 4**12],
+                [4**8,  4**9,  4**10, 4**11],
+                [4**7,  4**6,  4**5,  4**4],
+                [4**0,  4**1,  4**2,  4**3]]
+
+GRADIENT_MATRIX = [[4**6, 4**5, 4**4, 4**3],
+                   [4**5, 4**4, 4**3, 4**2],
+                   [4**4, 4**3, 4**2, 4**1],
+                   [4**3, 4**2, 4**1, 4**0]]
+
+# the same patterns for any board size: the snake numbers the cells 0, 1, 2, ... starting at the
+# bottom-left corner, alternating direction every row, and weighs cell k by 4**k
+def getSnakeMatrix(size):
+    matrix = [[0] * size for row in range(size)]
+    for k in range(size * size):
+        rowFromBottom, offset = divmod(k, size)
+        col = offset if rowFromBottom % 2 == 0 else size - 1 - offset
+        matrix[size - 1 - rowFromBottom][col] = 4**k
+    return matrix
+
+def getGradientMatrix(size):
+    return [[4**(2*size - 2 - row - col) for col in range(size)] for row in range(size)]
+
+def getWeights(weights=None):
+    fullWeights = dict(DEFAULT_WEIGHTS)
+    if weights:
+        fullWeights.update(weights)
+    return fullWeights
+
+# per-line features, all computed on tile values (not exponents) like the per-cell heuristics
+def lineMerges(tiles):
+    return sum(1 for i in range(len(tiles)-1) if tiles[i] and tiles[i] == tiles[i+1])
+
+def lineMonotonicity(tiles):
+    score = sum(abs(tiles[i] - tiles[i+1]) for i in range(len(tiles)-1))
+    if all(tiles[i] >= tiles[i+1] for i in range(len(tiles)-1)):
+        score += 1
+    return score
+
+def lineSnake(tiles, row, snakeMatrix=SNAKE_MATRIX):
+    return sum(tiles[col] * snakeMatrix[row][col] for col in range(len(tiles)))
+
+def buildFeatureTables():
+    merges = [0] * (bitboard.ROW_MASK + 1)
+    mono = [0] * (bitboard.ROW_MASK + 1)
+    snake = [[0] * (bitboard.ROW_MASK + 1) for row in range(bitboard.SIZE)]
+    for line in range(bitboard.ROW_MASK + 1):
+        tiles = [bitboard.exponentToTile(exp) for exp in bitboard.unpackRow(line)]
+        merges[line] = lineMerges(tiles)
+        mono[line] = lineMonotonicity(tiles)
+        for row in range(bitboard.SIZE):
+            snake[row][line] = lineSnake(tiles, row)
+    return merges, mono, snake
+
+featureTables = None
+
+def getFeatureTables():
+    global featureTables
+    if featureTables is None:
+        featureTables = buildFeatureTables()
+    return featureTables
+
+class Evaluator:
+    def __init__(self, weights=None):
+        self.weights = getWeights(weights)
+        w = self.weights
+        merges, mono, snake = getFeatureTables()
+        horizMerge = w['merge'] * w['horizMerge']
+        vertMerge = w['merge'] * w['vertMerge']
+        self.rowTables = [[w['smooth']*snake[row][line] + w['mono']*mono[line] + horizMerge*merges[line]
+                           for line in range(bitboard.ROW_MASK + 1)]
+                          for row in range(bitboard.SIZE)]
+        self.colTable = [w['mono']*mono[line] + vertMerge*merges[line]
+                         for line in range(bitboard.ROW_MASK + 1)]
+        # same running product as countEmptySquares: bonus grows by 1.1 per empty square
+        self.emptyBonus = []
+        count = 1
+        for empty in range(bitboard.SIZE*bitboard.SIZE + 1):
+            self.emptyBonus.append(w['empty'] * count)
+            count *= 1.1
+        self.batchTables = None
+
+    def evaluate(self, state):
+        mask = bitboard.ROW_MASK
+        rows = self.rowTables
+        colTable = self.colTable
+        cols = bitboard.transpose(state)
+        return (rows[0][state & mask] + rows[1][(state >> 16) & mask] +
+                rows[2][(state >> 32) & mask] + rows[3][state >> 48] +
+                colTable[cols & mask] + colTable[(cols >> 16) & mask] +
+                colTable[(cols >> 32) & mask] + colTable[cols >> 48] +
+                self.emptyBonus[bitboard.countEmpty(state)])
+
+    # vectorized evaluate() over a uint64 array of states; it gathers from the same tables and adds
+    # the terms in the same order, so every value is bit-for-bit equal to evaluate()
+    def evaluateBatch(self, states):
+        if self.batchTables is None:
+            self.batchTables = ([np.array(table) for table in self.rowTables],
+                                np.array(self.colTable), np.array(self.emptyBonus))
+        rowTables, colTable, emptyBonus = self.batchTables
+        r0, r1, r2, r3 = npboard.splitRows(states)
+        c0, c1, c2, c3 = npboard.splitRows(npboard.transposeStates(states))
+        return (rowTables[0][r0] + rowTables[1][r1] + rowTables[2][r2] + rowTables[3][r3] +
+                colTable[c0] + colTable[c1] + colTable[c2] + colTable[c3] +
+                emptyBonus[npboard.countEmptyStates(states)])
+
+# evaluate() for boards of any other size: same weighted per-line terms, but with 2**(N*bits)
+# possible lines a full table is out of reach, so each line's term is computed on first use and
+# cached (per row index for the rows, shared by the columns); a cache that reaches
+# bitboard.MAX_CACHED_ROWS lines starts over, so memory stays bounded however long it is used
+class SizedEvaluator:
+    def __init__(self, weights, size):
+        self.weights = getWeights(weights)
+        self.engine = bitboard.getEngine(size)
+        self.snakeMatrix = getSnakeMatrix(size)
+        self.rowTerms = [{} for row in range(size)]
+        self.colTerms = {}
+        self.emptyBonus = []
+        count = 1
+        for empty in range(size*size + 1):
+            self.emptyBonus.append(self.weights['empty'] * count)
+            count *= 1.1
+
+    def getLineTerm(self, line, row=None):
+        w = self.weights
+        tiles = [bitboard.exponentToTile(exp) for exp in self.engine.unpackRow(line)]
+        term = w['mono']*lineMonotonicity(tiles)
+        if row is None:
+            return term + w['merge']*w['vertMerge']*lineMerges(tiles)
+        return (w['smooth']*lineSnake(tiles, row, self.snakeMatrix) + term +
+                w['merge']*w['horizMerge']*lineMerges(tiles))
+
+    def evaluate(self, state):
+        total = 0
+        for row, line in enumerate(self.engine.getRows(state)):
+            rowTerms = self.rowTerms[row]
+            term = rowTerms.get(line)
+            if term is None:
+                if len(rowTerms) >= bitboard.MAX_CACHED_ROWS:
+                    rowTerms.clear()
+                term = rowTerms[line] = self.getLineTerm(line, row)
+            total += term
+        for line in self.engine.getColumns(state):
+            term = self.colTerms.get(line)
+            if term is None:
+                if len(self.colTerms) >= bitboard.MAX_CACHED_ROWS:
+                    self.colTerms.clear()
+                term = self.colTerms[line] = self.getLineTerm(line)
+            total += term
+        return total + self.emptyBonus[self.engine.countEmpty(state)]
+
+# evaluators are cached per weight vector (and board size) so solvers with the same weights share
+# one set of tables; the oldest is dropped past MAX_EVALUATORS so long tuning runs don't keep every
+# candidate's tables
+MAX_EVALUATORS = 8
+evaluators = {}
+
+def getEvaluator(weights=None, size=bitboard.SIZE):
+    key = (size, tuple(sorted(getWeights(weights).items())))
+    if key not in evaluators:
+        if len(evaluators) >= MAX_EVALUATORS:
+            del evaluators[next(iter(evaluators))]
+        evaluators[key] = Evaluator(weights) if size == bitboard.SIZE else SizedEvaluator(weights, size)
+    return evaluators[key]
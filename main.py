@@ -1,5 +1,6 @@
 from board import Board, mtpBoard1, mtpBoard2, aiBoard
 from ai import AISolver
+from asyncsolver import AsyncSolver
 from cmu_graphics import *
 import copy
 
@@ -8,13 +9,16 @@ import copy
 #=================================================================================================
 
 def onAppStart(app):
-    # board objects
-    app.classicBoard = Board(False, True)
-    app.aiBoard = aiBoard(False, True)   
+    # board objects (classic and ai boards can be 3x3 to 8x8, see onKeyPress)
+    app.boardSize = 4
+    app.classicBoard = Board(False, True, size=app.boardSize)
+    app.aiBoard = aiBoard(False, True, size=app.boardSize)
     app.mtpBoard1 = mtpBoard1(False, True)
     app.mtpBoard2 = mtpBoard2(False, True)
         
-    app.AISolver = AISolver(app.aiBoard)
+    app.aiMode = 'expectimax' # search engine of the ai board, M switches it (see AISolver.MODES)
+    app.AISolver = AISolver(app.aiBoard, mode=app.aiMode)
+    app.aiDriver = AsyncSolver(app.AISolver) # searches on a background thread, see onStep
     app.startAI = False
 
     # screen & presets
@@ -34,7 +38,7 @@ def onAppStart(app):
                   512: rgb(237, 200, 80),
                   1024: rgb(237, 197, 63),
                   2048: rgb(237, 194, 46),
-                  4096: rgb(0, 0, 0)} # any tile with value > 2048 is black
+                  4096: rgb(0, 0, 0)} # any tile with value > 2048 is black (see getTileColor)
 
     # title
     app.titleX = app.width//2
@@ -71,7 +75,8 @@ def onAppStart(app):
     app.aiLabelY = app.height*0.75
     app.aiLabelSize = app.classicLabelSize    
     
-    # board outline (classic & ai modes)
+    # board outline (classic & ai modes); rows/cols are the 4x4 layout grid used to size the score
+    # boxes, the cells themselves are sized from the board being drawn
     app.rows = len(app.classicBoard.getBoard())
     app.cols = len(app.classicBoard.getBoard(0))
     app.boardWidth = app.boardHeight = 0.6*app.height
@@ -130,6 +135,17 @@ def onAppStart(app):
 
     # end label
     app.endLabel = ''
+
+    # render caches: redrawAll runs every step, so cell geometry is computed once per board layout
+    # and the cell/score labels once per board state (see getBoardView/getScoreView)
+    app.cellLayouts = {}  # (slot, size) -> geometry of every cell
+    app.boardViews = {}   # slot -> ((mode, size, state), cells to draw)
+    app.scoreViews = {}   # slot -> ((state, score), (score, high score))
+    app.scoreLayout = None
+    app.mtpScoreLayout = None
+    # the ai search runs on a background thread; stepping (and so repainting) far faster than the
+    # screen refreshes would only take CPU time away from it
+    app.stepsPerSecond = 60
 #=================================================================================================
 #                                   VIEW
 #=================================================================================================
@@ -188,21 +204,18 @@ def drawBoard(app):
     elif app.mode == 'ai':
         board = app.aiBoard 
     # draw board outline
-    for row in range(len(board.getBoard())):
-        for col in range(len(board.getBoard(0))):
-            drawCell(app, row, col)
+    for cell in getBoardView(app, board):
+        drawCell(cell)
     drawBoardBorder(app)
 
 def drawBoards(app):
     # board 1
-    for row in range(len(app.mtpBoard1.getBoard())):
-        for col in range(len(app.mtpBoard1.getBoard(0))):
-            drawCell(app, row, col, app.mtpBoard1)
+    for cell in getBoardView(app, app.mtpBoard1, app.mtpBoard1):
+        drawCell(cell)
     drawBoardBorder(app, app.mtpBoard1)
     # board 2
-    for row in range(len(app.mtpBoard2.getBoard())):
-        for col in range(len(app.mtpBoard2.getBoard(0))):
-            drawCell(app, row, col, app.mtpBoard2)
+    for cell in getBoardView(app, app.mtpBoard2, app.mtpBoard2):
+        drawCell(cell)
     drawBoardBorder(app, app.mtpBoard2)
 
 # draw the board outline (with double-thickness)
@@ -220,39 +233,76 @@ def drawBoardBorder(app, mtpBoard=None):
                 fill=None, border='black',
                 borderWidth=app.cellBorderWidth*2)
 
-def drawCell(app, row, col, mtpBoard=None):
-    board = None
-    if app.mode == 'classic':
-        board = app.classicBoard
-    elif app.mode == 'ai':
-        board = app.aiBoard
-    elif app.mode == 'multiplayer':
-        board = mtpBoard
-    value = board.getBoard(row, col)
+def drawCell(cell):
+    (cellLeft, cellTop, cellWidth, cellHeight, fill, borderWidth,
+     valueString, labelX, labelY, labelSize, labelColor) = cell
     # outline
-    cellLeft, cellTop = getCellLeftTop(app, row, col, mtpBoard)
-    cellWidth, cellHeight = getCellSize(app, mtpBoard)      
-    drawRect(cellLeft, cellTop, cellWidth, cellHeight,
-             fill=app.colors[value], border='black',
-             borderWidth=app.cellBorderWidth)
+    drawRect(cellLeft, cellTop, cellWidth, cellHeight, fill=fill, border='black', borderWidth=borderWidth)
     # value
-    labelX = cellLeft + cellWidth//2
-    labelY = cellTop + cellHeight//2
-    labelSize = app.boardWidth//8
-    if app.mode == 'classic' or app.mode == 'multiplayer':
-        if value > 64:
-            labelSize *= 0.8
-        elif value > 512:
-            labelSize *= 0.6
-    elif app.mode == 'ai':
-        if value > 512:
-            labelSize *= 0.8 
-    valueString = f'{value}' if value else ''
-    labelColor = 'black' if value < 8 else 'white'
     drawLabel(valueString, labelX, labelY, font='arial', size=labelSize, bold=True, fill=labelColor)
 
-def getCellLeftTop(app, row, col, mtpBoard=None):
-    cellWidth, cellHeight = getCellSize(app)
+# which cached board a view belongs to: the classic/ai board or one of the multiplayer boards
+def getBoardSlot(app, mtpBoard=None):
+    if mtpBoard is None:
+        return 'main'
+    return 'mtp1' if mtpBoard == app.mtpBoard1 else 'mtp2'
+
+# (left, top, width, height, labelX, labelY) of every cell in row-major order; only depends on
+# where the board is drawn and its size, so it is computed once per layout
+def getCellLayout(app, board, mtpBoard=None):
+    key = (getBoardSlot(app, mtpBoard), board.size)
+    if key not in app.cellLayouts:
+        cellWidth, cellHeight = getCellSize(app, mtpBoard, board)
+        layout = []
+        for row in range(board.size):
+            for col in range(board.size):
+                cellLeft, cellTop = getCellLeftTop(app, row, col, mtpBoard, board)
+                layout.append((cellLeft, cellTop, cellWidth, cellHeight,
+                               cellLeft + cellWidth//2, cellTop + cellHeight//2))
+        app.cellLayouts[key] = layout
+    return app.cellLayouts[key]
+
+# everything drawCell needs for each cell of board, rebuilt only when the board state changes
+def getBoardView(app, board, mtpBoard=None):
+    slot = getBoardSlot(app, mtpBoard)
+    key = (app.mode, board.size, board.state)
+    cached = app.boardViews.get(slot)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    grid = board.getBoard()
+    cells = []
+    for i, (cellLeft, cellTop, cellWidth, cellHeight, labelX, labelY) in enumerate(getCellLayout(app, board, mtpBoard)):
+        value = grid[i // board.size][i % board.size]
+        labelSize = app.boardWidth//(2*board.size)
+        if app.mode == 'classic' or app.mode == 'multiplayer':
+            if value > 64:
+                labelSize *= 0.8
+            elif value > 512:
+                labelSize *= 0.6
+        elif app.mode == 'ai':
+            if value > 512:
+                labelSize *= 0.8 
+        valueString = f'{value}' if value else ''
+        labelColor = 'black' if value < 8 else 'white'
+        cells.append((cellLeft, cellTop, cellWidth, cellHeight, getTileColor(app, value),
+                      app.cellBorderWidth, valueString, labelX, labelY, labelSize, labelColor))
+    app.boardViews[slot] = (key, cells)
+    return cells
+
+# (score, high score) of board, looked up again only after a move or restart changed it
+def getScoreView(app, board, slot):
+    key = (board.state, board.getScore())
+    cached = app.scoreViews.get(slot)
+    if cached is None or cached[0] != key:
+        cached = (key, (board.getScore(), board.getHighScore()))
+        app.scoreViews[slot] = cached
+    return cached[1]
+
+def getTileColor(app, value):
+    return app.colors.get(value, app.colors[4096])
+
+def getCellLeftTop(app, row, col, mtpBoard=None, board=None):
+    cellWidth, cellHeight = getCellSize(app, None, board)
     cellLeft = app.boardLeft + col * cellWidth
     cellTop = app.boardTop + row * cellHeight
     if mtpBoard:
@@ -261,15 +311,34 @@ def getCellLeftTop(app, row, col, mtpBoard=None):
         cellTop = app.mtpBoardTop + row * cellHeight
     return (cellLeft, cellTop)
 
-def getCellSize(app, mtpBoard=None):    
-    cellWidth = app.boardWidth / app.cols
-    cellHeight = app.boardHeight / app.rows
+def getCellSize(app, mtpBoard=None, board=None):
+    rows, cols = (board.size, board.size) if board else (app.rows, app.cols)
+    cellWidth = app.boardWidth / cols
+    cellHeight = app.boardHeight / rows
     if mtpBoard:
         cellWidth = app.mtpBoardWidth / app.mtpCols
         cellHeight = app.mtpBoardHeight / app.mtpRows
     return (cellWidth, cellHeight)
 
+# score boxes: the geometry is fixed, so it is computed on the first draw and reused; the values
+# come from getScoreView
 def drawScores(app):
+    if app.scoreLayout is None:
+        app.scoreLayout = getScoreLayout(app)
+    rects, titles, valueLabels = app.scoreLayout
+
+    # at the start no board exists
+    score = 0
+    highScore = 0
+
+    if app.mode == 'classic':
+        score, highScore = getScoreView(app, app.classicBoard, 'classic')
+    elif app.mode == 'ai':
+        score, highScore = getScoreView(app, app.aiBoard, 'ai')
+
+    drawScoreBoxes(app, rects, titles, valueLabels, [score, highScore])
+
+def getScoreLayout(app):
     # outline
     cellWidth, cellHeight = getCellSize(app)
 
@@ -283,9 +352,6 @@ def drawScores(app):
     bestWidth = scoreWidth
     bestHeight = scoreHeight
 
-    drawRect(scoreX, scoreY, scoreWidth, scoreHeight, fill=app.colors[0])
-    drawRect(bestX, bestY, bestWidth, bestHeight, fill=app.colors[0])
-    
     # values
     scoreLabelX1 = scoreX + scoreWidth // 2
     scoreLabelY1 = scoreY + scoreHeight // 4
@@ -297,24 +363,24 @@ def drawScores(app):
     bestLabelX2 = bestLabelX1
     bestLabelY2 = scoreLabelY2
 
-    # at the start no board exists
-    score = 0
-    highScore = 0
+    rects = [(scoreX, scoreY, scoreWidth, scoreHeight), (bestX, bestY, bestWidth, bestHeight)]
+    titles = [('SCORE', scoreLabelX1, scoreLabelY1, scoreHeight*0.25),
+              ('BEST', bestLabelX1, bestLabelY1, scoreHeight*0.25)]
+    valueLabels = [(scoreLabelX2, scoreLabelY2, scoreHeight*0.45),
+                   (bestLabelX2, bestLabelY2, bestHeight*0.4)]
+    return (rects, titles, valueLabels)
 
-    if app.mode == 'classic':
-        score = app.classicBoard.getScore()
-        highScore = app.classicBoard.getHighScore()
-    elif app.mode == 'ai':
-        score = app.aiBoard.getScore()
-        highScore = app.aiBoard.getHighScore()    
+def drawScoresMtp(app):
+    if app.mtpScoreLayout is None:
+        app.mtpScoreLayout = getScoreLayoutMtp(app)
+    rects, titles, valueLabels = app.mtpScoreLayout
 
-    drawLabel('SCORE', scoreLabelX1, scoreLabelY1, bold=True, size=scoreHeight*0.25)    
-    drawLabel(f'{score}', scoreLabelX2, scoreLabelY2, fill='white', bold=True, size=scoreHeight*0.45)
+    score1, highScore1 = getScoreView(app, app.mtpBoard1, 'mtp1')
+    score2, highScore2 = getScoreView(app, app.mtpBoard2, 'mtp2')
 
-    drawLabel('BEST', bestLabelX1, bestLabelY1, bold=True, size=scoreHeight*0.25)
-    drawLabel(f'{highScore}', bestLabelX2, bestLabelY2, fill='white', bold=True, size=bestHeight*0.4)
+    drawScoreBoxes(app, rects, titles, valueLabels, [score1, highScore1, score2, highScore2])
 
-def drawScoresMtp(app):
+def getScoreLayoutMtp(app):
     # outline
     cellWidth, cellHeight = getCellSize(app, app.mtpBoard1)
 
@@ -332,11 +398,6 @@ def drawScoresMtp(app):
     bestWidth = scoreWidth
     bestHeight = scoreHeight
 
-    drawRect(scoreX1, scoreY1, scoreWidth, scoreHeight, fill=app.colors[0])
-    drawRect(bestX1, bestY1, bestWidth, bestHeight, fill=app.colors[0])
-    drawRect(scoreX2, scoreY2, scoreWidth, scoreHeight, fill=app.colors[0])
-    drawRect(bestX2, bestY2, bestWidth, bestHeight, fill=app.colors[0])
-    
     # values
 
     # player 1
@@ -361,24 +422,24 @@ def drawScoresMtp(app):
     bestLabelX2P2 = bestLabelX1P2
     bestLabelY2P2 = scoreLabelY2P2
 
-    score1 = app.mtpBoard1.getScore()
-    highScore1 = app.mtpBoard1.getHighScore()
-    score2 = app.mtpBoard2.getScore()
-    highScore2 = app.mtpBoard2.getHighScore()
-
-    # player 1
-    drawLabel('SCORE', scoreLabelX1P1, scoreLabelY1P1, bold=True, size=scoreHeight*0.25)    
-    drawLabel(f'{score1}', scoreLabelX2P1, scoreLabelY2P1, fill='white', bold=True, size=scoreHeight*0.45)
-
-    drawLabel('BEST', bestLabelX1P1, bestLabelY1P1, bold=True, size=scoreHeight*0.25)
-    drawLabel(f'{highScore1}', bestLabelX2P1, bestLabelY2P1, fill='white', bold=True, size=bestHeight*0.4)
-
-    # player 2
-    drawLabel('SCORE', scoreLabelX1P2, scoreLabelY1P2, bold=True, size=scoreHeight*0.25)    
-    drawLabel(f'{score2}', scoreLabelX2P2, scoreLabelY2P2, fill='white', bold=True, size=scoreHeight*0.45)
-
-    drawLabel('BEST', bestLabelX1P2, bestLabelY1P2, bold=True, size=scoreHeight*0.25)
-    drawLabel(f'{highScore2}', bestLabelX2P2, bestLabelY2P2, fill='white', bold=True, size=bestHeight*0.4)
+    rects = [(scoreX1, scoreY1, scoreWidth, scoreHeight), (bestX1, bestY1, bestWidth, bestHeight),
+             (scoreX2, scoreY2, scoreWidth, scoreHeight), (bestX2, bestY2, bestWidth, bestHeight)]
+    titles = [('SCORE', scoreLabelX1P1, scoreLabelY1P1, scoreHeight*0.25),
+              ('BEST', bestLabelX1P1, bestLabelY1P1, scoreHeight*0.25),
+              ('SCORE', scoreLabelX1P2, scoreLabelY1P2, scoreHeight*0.25),
+              ('BEST', bestLabelX1P2, bestLabelY1P2, scoreHeight*0.25)]
+    valueLabels = [(scoreLabelX2P1, scoreLabelY2P1, scoreHeight*0.45),
+                   (bestLabelX2P1, bestLabelY2P1, bestHeight*0.4),
+                   (scoreLabelX2P2, scoreLabelY2P2, scoreHeight*0.45),
+                   (bestLabelX2P2, bestLabelY2P2, bestHeight*0.4)]
+    return (rects, titles, valueLabels)
+
+def drawScoreBoxes(app, rects, titles, valueLabels, values):
+    for rectX, rectY, rectWidth, rectHeight in rects:
+        drawRect(rectX, rectY, rectWidth, rectHeight, fill=app.colors[0])
+    for (title, titleX, titleY, titleSize), (labelX, labelY, labelSize), value in zip(titles, valueLabels, values):
+        drawLabel(title, titleX, titleY, bold=True, size=titleSize)
+        drawLabel(f'{value}', labelX, labelY, fill='white', bold=True, size=labelSize)
 
 def drawHomeButton(app):
     drawRect(app.homeRectX, app.homeRectY, app.homeRectWidth, app.homeRectHeight, fill=app.homeRectColor, border='black')
@@ -406,7 +467,7 @@ def drawInstructions(app):
     if app.mode == 'classic':
         instructions = 'Use your arrow keys to move and merge the tiles \nto reach 2048.'
     elif app.mode == 'ai':
-        instructions = 'AI solves 2048'
+        instructions = f'AI solves 2048 ({app.aiMode}) \nPress M to switch the search engine.'
     drawLabel(instructions, app.instructionsLabelX2, app.instructionsLabelY2, size=app.instructionsLabelSize2, align='right')
 
 def drawStartButton(app):
@@ -421,7 +482,16 @@ def drawStartButton(app):
 def onKeyPress(app, key):
     player1Init = app.mtpBoard1.getScore()
     player2Init = app.mtpBoard2.getScore()
-    if app.mode == 'classic':
+    # 3-8 restart the classic/ai board at that size
+    if app.mode in ['classic', 'ai'] and key in ['3', '4', '5', '6', '7', '8']:
+        app.boardSize = int(key)
+        restartBoard(app)
+    elif app.mode == 'ai' and key == 'm':
+        modes = AISolver.MODES
+        app.aiMode = modes[(modes.index(app.aiMode) + 1) % len(modes)]
+        app.AISolver = AISolver(app.aiBoard, mode=app.aiMode)
+        app.aiDriver.cancel(app.AISolver)
+    elif app.mode == 'classic':
         app.classicBoard.performMove(key)
     elif app.mode == 'multiplayer':
         if not (app.mtpBoard1.gameOver() or app.mtpBoard2.gameOver()):
@@ -480,6 +550,7 @@ def onMouseMove(app, mouseX, mouseY):
 def onMousePress(app, mouseX, mouseY):
     if onHomeButton(app, mouseX, mouseY):
         app.mode = 'home'
+        app.aiDriver.cancel()
     elif app.mode == 'home':
         if onClassicMode(app, mouseX, mouseY):
             app.mode = 'classic'
@@ -489,11 +560,7 @@ def onMousePress(app, mouseX, mouseY):
             app.mode = 'multiplayer'
     elif app.mode == 'classic' or app.mode == 'ai':
         if onRestartButton(app, mouseX, mouseY):
-            if app.mode == 'classic':
-                app.classicBoard = Board(False, True)
-            elif app.mode == 'ai':
-                app.aiBoard = aiBoard(False, True)
-                app.AISolver = AISolver(app.aiBoard)           
+            restartBoard(app)
         elif onStartButton(app, mouseX, mouseY):
             app.startAI = True
     elif app.mode == 'multiplayer':
@@ -501,8 +568,15 @@ def onMousePress(app, mouseX, mouseY):
             app.mtpBoard1 = mtpBoard1(False, True)
             app.mtpBoard2 = mtpBoard2(False, True)
 
+def restartBoard(app):
+    if app.mode == 'classic':
+        app.classicBoard = Board(False, True, size=app.boardSize)
+    elif app.mode == 'ai':
+        app.aiBoard = aiBoard(False, True, size=app.boardSize)
+        app.AISolver = AISolver(app.aiBoard, mode=app.aiMode)
+        app.aiDriver.cancel(app.AISolver)
+
 def onStep(app):
-    app.stepsPerSecond = 1000
     if app.mode == 'classic':
         if app.classicBoard.gameOver():
             app.endLabel = 'GAME OVER'
@@ -530,11 +604,14 @@ def onStep(app):
     elif app.mode == 'ai':
         # if app.startAI and not (app.aiBoard.gameOver() or app.aiBoard.winGame()):
         if app.startAI:
-            aiMove = app.AISolver.getNextMove(app.aiBoard)
-            if not aiMove:
-                app.startAI = False
-            # aiMove, _ = app.AISolver.minimax(app.aiBoard)
-            app.aiBoard.performMove(aiMove)
+            # the search runs in the background: apply a finished move, then ask for the next one
+            ready, aiMove = app.aiDriver.poll(app.aiBoard)
+            if ready:
+                if not aiMove:
+                    app.startAI = False
+                app.aiBoard.performMove(aiMove)
+            if app.startAI:
+                app.aiDriver.request(app.aiBoard)
             app.endLabel = ''
         else:
             app.startAI = False
@@ -0,0 +1,158 @@
+import numpy as np
+import bitboard
+
+#=================================================================================================
+# NumPy versions of the bitboard operations: the same packed 64-bit boards (see bitboard.py),
+# held in a uint64 array so one call moves, transposes or counts a whole batch of boards through
+# the same 65536-entry row tables.
+#=================================================================================================
+
+ROW_MASK = np.uint64(bitboard.ROW_MASK)
+SHIFTS = [np.uint64(16 * row) for row in range(bitboard.SIZE)]
+
+LEFT_TABLE = np.array(bitboard.LEFT_TABLE, dtype=np.uint64)
+RIGHT_TABLE = np.array(bitboard.RIGHT_TABLE, dtype=np.uint64)
+LEFT_SCORES = np.array(bitboard.LEFT_SCORES, dtype=np.int64)
+RIGHT_SCORES = np.array(bitboard.RIGHT_SCORES, dtype=np.int64)
+EMPTY_COUNTS = np.array([bitboard.unpackRow(row).count(0) for row in range(bitboard.ROW_MASK + 1)],
+                        dtype=np.int64)
+
+def toArray(states):
+    return np.array(states, dtype=np.uint64)
+
+# the four 16-bit rows of every board, as indices into the row tables
+def splitRows(states):
+    return [((states >> shift) & ROW_MASK).astype(np.intp) for shift in SHIFTS]
+
+def transposeStates(states):
+    a1 = states & np.uint64(0xF0F00F0FF0F00F0F)
+    a2 = states & np.uint64(0x0000F0F00000F0F0)
+    a3 = states & np.uint64(0x0F0F00000F0F0000)
+    a = a1 | (a2 << np.uint64(12)) | (a3 >> np.uint64(12))
+    b1 = a & np.uint64(0xFF00FF0000FF00FF)
+    b2 = a & np.uint64(0x00FF00FF00000000)
+    b3 = a & np.uint64(0x00000000FF00FF00)
+    return b1 | (b2 >> np.uint64(24)) | (b3 << np.uint64(24))
+
+def moveRows(states, table, scores):
+    r0, r1, r2, r3 = splitRows(states)
+    newStates = (table[r0] | (table[r1] << SHIFTS[1]) |
+                 (table[r2] << SHIFTS[2]) | (table[r3] << SHIFTS[3]))
+    return newStates, scores[r0] + scores[r1] + scores[r2] + scores[r3]
+
+# returns (new states, points gained per board); an unknown direction leaves the boards untouched
+def executeMoves(states, direction):
+    if direction == 'left':
+        return moveRows(states, LEFT_TABLE, LEFT_SCORES)
+    elif direction == 'right':
+        return moveRows(states, RIGHT_TABLE, RIGHT_SCORES)
+    elif direction == 'up':
+        newStates, points = moveRows(transposeStates(states), LEFT_TABLE, LEFT_SCORES)
+        return transposeStates(newStates), points
+    elif direction == 'down':
+        newStates, points = moveRows(transposeStates(states), RIGHT_TABLE, RIGHT_SCORES)
+        return transposeStates(newStates), points
+    return states.copy(), np.zeros(len(states), dtype=np.int64)
+
+def countEmptyStates(states):
+    r0, r1, r2, r3 = splitRows(states)
+    return EMPTY_COUNTS[r0] + EMPTY_COUNTS[r1] + EMPTY_COUNTS[r2] + EMPTY_COUNTS[r3]
+
+#=================================================================================================
+# BatchBoard: B independent 4x4 games advanced in lockstep, held as one packed uint64 array.
+# - performMoves applies one direction per game (or one for all) with four batched table passes,
+#   then spawns a tile on every game that moved, all without a Python loop over the games
+# - spawns are drawn from a NumPy Generator: a uniform cell among each board's empty cells
+#   (found by a cumulative count over the (B, 16) exponent view) and a 2 or a 4 (90% / 10%)
+# - per-game score, move count and terminal mask are kept up to date; finished games are never
+#   moved again, so a batch can simply be stepped until done.all()
+# Directions are given as indices into bitboard.DIRECTIONS (or as one direction name).
+#=================================================================================================
+
+CELL_SHIFTS = np.arange(0, 64, 4, dtype=np.uint64)
+
+class BatchBoard:
+    def __init__(self, count=None, states=None, seed=None, addTiles=True):
+        self.rng = np.random.default_rng(seed)
+        if states is None:
+            self.states = np.zeros(count, dtype=np.uint64)
+        else:
+            self.states = toArray(states)
+            addTiles = False
+        self.scores = np.zeros(len(self.states), dtype=np.int64)
+        self.moves = np.zeros(len(self.states), dtype=np.int64)
+        self.moveResults = None # (states, getMoveResults() of those states)
+        self.done = np.zeros(len(self.states), dtype=bool)
+        if addTiles:
+            self.spawnTiles()
+            self.spawnTiles()
+        self.done = ~self.getLegalMoves().any(axis=1)
+
+    def __len__(self):
+        return len(self.states)
+
+    # (B, 16) tile exponents, cell (row, col) at column 4*row + col
+    def getExponents(self):
+        return ((self.states[:, None] >> CELL_SHIFTS) & np.uint64(0xF)).astype(np.uint8)
+
+    def getMaxTiles(self):
+        return np.left_shift(1, self.getExponents().max(axis=1).astype(np.int64))
+
+    # the four moves of every game: (new states, points, legal), each shaped (4, B); kept until
+    # the states change, since the terminal check, random move choice and next move all need them
+    def getMoveResults(self):
+        if self.moveResults is not None and self.moveResults[0] is self.states:
+            return self.moveResults[1]
+        results = [executeMoves(self.states, direction) for direction in bitboard.DIRECTIONS]
+        newStates = np.stack([newStates for newStates, _ in results])
+        points = np.stack([points for _, points in results])
+        self.moveResults = (self.states, (newStates, points, newStates != self.states))
+        return self.moveResults[1]
+
+    # (B, 4) mask of legal directions
+    def getLegalMoves(self):
+        return self.getMoveResults()[2].T
+
+    # puts a random tile in a random empty cell of every game selected by mask (all by default);
+    # games without an empty cell are left alone, and games left without a legal move are done
+    def spawnTiles(self, mask=None):
+        empty = self.getExponents() == 0
+        if mask is not None:
+            empty &= mask[:, None]
+        emptyCounts = empty.sum(axis=1)
+        spawning = emptyCounts > 0
+        picks = (self.rng.random(len(self)) * emptyCounts).astype(np.int64)
+        cells = (np.cumsum(empty, axis=1) > picks[:, None]).argmax(axis=1)
+        exponents = np.where(self.rng.random(len(self)) < 0.9, 1, 2).astype(np.uint64)
+        tiles = exponents << (np.uint64(4) * cells.astype(np.uint64))
+        self.states = np.where(spawning, self.states | tiles, self.states)
+        self.done |= ~self.getLegalMoves().any(axis=1)
+
+    # moves every unfinished game in its direction (one name, or an index array with one entry per
+    # game) and spawns on the games that moved; returns (legal, points gained, done), per game
+    def performMoves(self, directions):
+        newStates, points, legal = self.getMoveResults()
+        if isinstance(directions, str):
+            directions = np.full(len(self), bitboard.DIRECTIONS.index(directions))
+        games = np.arange(len(self))
+        moved = legal[directions, games] & ~self.done
+        gained = np.where(moved, points[directions, games], 0)
+        self.states = np.where(moved, newStates[directions, games], self.states)
+        self.scores += gained
+        self.moves += moved
+        self.spawnTiles(moved)
+        return moved, gained, self.done.copy()
+
+    # a uniformly random legal direction per game (index into bitboard.DIRECTIONS); finished games
+    # get 0, which performMoves ignores
+    def getRandomMoves(self):
+        keys = np.where(self.getLegalMoves(), self.rng.random((len(self), 4)), -1)
+        return keys.argmax(axis=1)
+
+    # plays uniformly random legal moves until every game is over or maxMoves steps have passed
+    def playRandom(self, maxMoves=None):
+        steps = 0
+        while not self.done.all() and (maxMoves is None or steps < maxMoves):
+            self.performMoves(self.getRandomMoves())
+            steps += 1
+        return self.scores
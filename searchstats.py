@@ -0,0 +1,66 @@
+from collections import defaultdict
+
+#=================================================================================================
+# Per-move search statistics collected by AISolver when instrumentation is turned on
+# (AISolver(..., instrument=True) or a traceCallback). One SearchStats object describes one
+# getNextMove call: nodes expanded per depth, leaf evaluations, time per phase, the depth that was
+# searched, and the cache and pruning counters of that call.
+# In parallel mode only the work done in the calling process is counted.
+#=================================================================================================
+
+class SearchStats:
+    def __init__(self):
+        self.move = None
+        self.depth = None
+        self.chanceNodes = defaultdict(int) # currentDepth -> chance nodes expanded
+        self.maxNodes = defaultdict(int)    # currentDepth -> max (player) nodes expanded
+        self.leafEvaluations = 0
+        self.totalSeconds = 0
+        self.leafSeconds = 0
+        self.cacheHits = 0
+        self.cacheMisses = 0
+        self.cacheEvictions = 0
+        self.prunedNodes = 0
+        self.sampledNodes = 0
+
+    def addLeaves(self, count, seconds):
+        self.leafEvaluations += count
+        self.leafSeconds += seconds
+
+    def getTotalNodes(self):
+        return sum(self.chanceNodes.values()) + sum(self.maxNodes.values()) + self.leafEvaluations
+
+    # node counts layer by layer: chance 0, max 0, chance 1, max 1, ..., leaves
+    def getLayerCounts(self):
+        layers = []
+        for depth in sorted(set(self.chanceNodes) | set(self.maxNodes)):
+            layers.append(self.chanceNodes[depth])
+            layers.append(self.maxNodes[depth])
+        layers.append(self.leafEvaluations)
+        return layers
+
+    # ratio between consecutive non-empty layers, i.e. the effective branching factor per ply
+    def getBranchingFactors(self):
+        layers = [count for count in self.getLayerCounts() if count]
+        return [layers[i+1] / layers[i] for i in range(len(layers)-1)]
+
+    def getPhaseSeconds(self):
+        return {'total': self.totalSeconds,
+                'leafEvaluation': self.leafSeconds,
+                'expansion': max(0, self.totalSeconds - self.leafSeconds)}
+
+    def toDict(self):
+        return {'move': self.move,
+                'depth': self.depth,
+                'nodes': self.getTotalNodes(),
+                'chanceNodes': dict(self.chanceNodes),
+                'maxNodes': dict(self.maxNodes),
+                'leafEvaluations': self.leafEvaluations,
+                'branchingFactors': self.getBranchingFactors(),
+                'phaseSeconds': self.getPhaseSeconds(),
+                'nodesPerSecond': self.getTotalNodes() / self.totalSeconds if self.totalSeconds else 0,
+                'cache': {'hits': self.cacheHits,
+                          'misses': self.cacheMisses,
+                          'evictions': self.cacheEvictions},
+                'pruning': {'prunedNodes': self.prunedNodes,
+                            'sampledNodes': self.sampledNodes}}
@@ -0,0 +1,153 @@
+import argparse
+import bisect
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from simulate import playGame, ResultWriter, RESULT_FIELDS
+from ai import AISolver
+from gamerecord import RecordWriter
+
+#=================================================================================================
+# Self-play farm: fans games out over a process pool, one deterministic seed per game
+# (baseSeed + game index), and streams results back as games finish. SelfPlayStats keeps the
+# aggregates (mean/median/percentiles, rates of reaching 2048/4096/8192, per-worker throughput)
+# up to date as each result arrives.
+# Example: python selfplay.py --games 1000 --workers 16 --seed 0 --output games.jsonl
+#=================================================================================================
+
+MILESTONES = [2048, 4096, 8192]
+PERCENTILES = [10, 25, 75, 90, 99]
+
+# with record=True the game's binary record comes back in result['record'] (bytes)
+def playSeededGame(game, seed, maxDepth, maxMoves, timeLimit=None, record=False, commonSpawns=False,
+                   size=4, cachePath=None, mode='expectimax', playouts=200, playoutDepth=None):
+    recordBuffer = io.BytesIO() if record else None
+    recorder = RecordWriter(recordBuffer, header=False) if record else None
+    result = playGame(game, seed, maxDepth, maxMoves, timeLimit, recorder, commonSpawns, size=size,
+                      cachePath=cachePath, mode=mode, playouts=playouts, playoutDepth=playoutDepth)
+    result['worker'] = os.getpid()
+    if record:
+        result['record'] = recordBuffer.getvalue()
+    return result
+
+class SelfPlayStats:
+    def __init__(self):
+        self.games = 0
+        self.totalScore = 0
+        self.scores = [] # kept sorted for the median and percentiles
+        self.milestoneCounts = {tile: 0 for tile in MILESTONES}
+        self.workers = {} # pid -> {'games', 'moves', 'seconds'}
+        self.startTime = time.perf_counter()
+
+    def add(self, result):
+        self.games += 1
+        self.totalScore += result['score']
+        bisect.insort(self.scores, result['score'])
+        for tile in MILESTONES:
+            if result['maxTile'] >= tile:
+                self.milestoneCounts[tile] += 1
+        worker = self.workers.setdefault(result.get('worker'), {'games': 0, 'moves': 0, 'seconds': 0})
+        worker['games'] += 1
+        worker['moves'] += result['moves']
+        worker['seconds'] += result['seconds']
+
+    def percentile(self, p):
+        if not self.scores:
+            return 0
+        # nearest-rank percentile
+        rank = max(0, min(len(self.scores) - 1, round(p / 100 * len(self.scores) + 0.5) - 1))
+        return self.scores[rank]
+
+    def median(self):
+        if not self.scores:
+            return 0
+        mid = len(self.scores) // 2
+        if len(self.scores) % 2:
+            return self.scores[mid]
+        return (self.scores[mid-1] + self.scores[mid]) / 2
+
+    def getSummary(self):
+        elapsed = time.perf_counter() - self.startTime
+        totalMoves = sum(worker['moves'] for worker in self.workers.values())
+        return {'games': self.games,
+                'meanScore': self.totalScore / self.games if self.games else 0,
+                'medianScore': self.median(),
+                'percentiles': {str(p): self.percentile(p) for p in PERCENTILES},
+                'reachRates': {str(tile): count / self.games if self.games else 0
+                               for tile, count in self.milestoneCounts.items()},
+                'elapsedSeconds': round(elapsed, 2),
+                'movesPerSecond': round(totalMoves / elapsed, 2) if elapsed > 0 else 0,
+                'workers': {str(pid): {'games': worker['games'],
+                                       'movesPerSecond': round(worker['moves'] / worker['seconds'], 2)
+                                                         if worker['seconds'] > 0 else 0}
+                            for pid, worker in self.workers.items()}}
+
+# plays numGames over `workers` processes and yields (result, stats) as each game finishes
+def runSelfPlay(numGames, workers=None, baseSeed=0, maxDepth=2, maxMoves=None, timeLimit=None,
+                record=False, commonSpawns=False, size=4, cachePath=None, mode='expectimax',
+                playouts=200, playoutDepth=None):
+    stats = SelfPlayStats()
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = [pool.submit(playSeededGame, game, baseSeed + game, maxDepth, maxMoves, timeLimit,
+                               record, commonSpawns, size, cachePath, mode, playouts, playoutDepth)
+                   for game in range(numGames)]
+        for future in as_completed(futures):
+            result = future.result()
+            stats.add(result)
+            yield result, stats
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Play seeded 2048 AI games over a process pool.')
+    parser.add_argument('--games', type=int, default=100, help='number of games to play')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: all cores)')
+    parser.add_argument('--seed', type=int, default=0, help='game i is played with seed+i')
+    parser.add_argument('--depth', type=int, default=2, help='search depth')
+    parser.add_argument('--mode', choices=AISolver.MODES, default='expectimax',
+                        help='search engine (minimax assumes the worst spawn instead of a random one)')
+    parser.add_argument('--playouts', type=int, default=200, help='montecarlo playouts per root move')
+    parser.add_argument('--playout-depth', type=int, default=None,
+                        help='montecarlo playout length in moves (default: play to the end of the game)')
+    parser.add_argument('--max-moves', type=int, default=None, help='stop each game after this many moves')
+    parser.add_argument('--time-limit', type=float, default=None,
+                        help='per-move time budget in seconds (iterative deepening instead of --depth)')
+    parser.add_argument('--format', choices=['jsonl', 'csv'], default='jsonl')
+    parser.add_argument('--output', default='-', help="per-game results file ('-' for stdout)")
+    parser.add_argument('--report-every', type=int, default=10,
+                        help='print the running aggregates to stderr every N games')
+    parser.add_argument('--record', default=None,
+                        help='also write every game to this binary record file (in finishing order)')
+    parser.add_argument('--common-spawns', action='store_true',
+                        help='same seed -> same spawn random numbers for any solver settings')
+    parser.add_argument('--size', type=int, default=4, help='board size (3 to 8)')
+    parser.add_argument('--cache', default=None,
+                        help='persistent transposition table file shared by all workers and later runs')
+    args = parser.parse_args(argv)
+
+    out = sys.stdout if args.output == '-' else open(args.output, 'w', newline='')
+    recordFile = open(args.record, 'wb') if args.record else None
+    try:
+        writer = ResultWriter(out, args.format, RESULT_FIELDS + ['worker'])
+        recorder = RecordWriter(recordFile) if recordFile else None
+        stats = None
+        for result, stats in runSelfPlay(args.games, args.workers, args.seed, args.depth,
+                                         args.max_moves, args.time_limit, recorder is not None,
+                                         args.common_spawns, args.size, args.cache, args.mode,
+                                         args.playouts, args.playout_depth):
+            if recorder:
+                recorder.appendGame(result.pop('record'))
+            writer.write(result)
+            if args.report_every and stats.games % args.report_every == 0:
+                print(json.dumps(stats.getSummary()), file=sys.stderr)
+        if stats:
+            print(json.dumps(stats.getSummary(), indent=2), file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        if recordFile:
+            recordFile.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+import argparse
+import csv
+import json
+import sys
+import time
+from board import aiBoard, SpawnStream
+from ai import AISolver, getTableFingerprint
+from gamerecord import RecordWriter
+from transposition import MappedTable
+
+#=================================================================================================
+# Headless runner: plays complete AI games with aiBoard + AISolver.getNextMove and never imports
+# cmu_graphics, so it can run on servers without a display.
+# Example: python simulate.py --games 100 --depth 2 --format csv --output results.csv
+#=================================================================================================
+
+RESULT_FIELDS = ['game', 'seed', 'score', 'maxTile', 'moves', 'seconds', 'movesPerSecond']
+
+# recorder: optional gamerecord.RecordWriter that receives every move as it is played
+# commonSpawns: draw spawns from a SpawnStream, so games with the same seed see the same random
+#               numbers whatever the solver does (common random numbers for comparing configurations)
+# weights: heuristic weight overrides passed to AISolver
+# size: board size (3 to 8)
+# cachePath: persistent transposition table file (see openCache) shared by every game and run
+# mode: search engine, one of AISolver.MODES; playouts/playoutDepth configure 'montecarlo'
+def playGame(game=0, seed=None, maxDepth=2, maxMoves=None, timeLimit=None, recorder=None,
+             commonSpawns=False, weights=None, size=4, cachePath=None, mode='expectimax',
+             playouts=200, playoutDepth=None):
+    if commonSpawns:
+        board = aiBoard(False, True, spawns=SpawnStream(seed), size=size)
+    else:
+        board = aiBoard(False, True, seed=seed, size=size)
+    table = openCache(cachePath, weights, size) if cachePath else None
+    solver = AISolver(board, maxDepth=maxDepth, timeLimit=timeLimit, weights=weights, table=table,
+                      mode=mode, playouts=playouts, playoutDepth=playoutDepth, seed=seed)
+    if recorder is not None:
+        recorder.startGame(board)
+    moves = 0
+    startTime = time.perf_counter()
+    while maxMoves is None or moves < maxMoves:
+        move = solver.getNextMove(board)
+        if not move:
+            break
+        previousState = board.state
+        board.performMove(move)
+        if recorder is not None:
+            recorder.writeMove(move, previousState, board.state)
+        moves += 1
+    seconds = time.perf_counter() - startTime
+    if recorder is not None:
+        recorder.endGame()
+    return {'game': game,
+            'seed': seed,
+            'score': board.getScore(),
+            'maxTile': board.getMaxTile(),
+            'moves': moves,
+            'seconds': round(seconds, 4),
+            'movesPerSecond': round(moves / seconds, 2) if seconds > 0 else 0}
+
+# one MappedTable per cache file and process, opened on first use and reused by later games
+cacheTables = {}
+
+def openCache(path, weights=None, size=4, slots=1 << 22):
+    if path not in cacheTables:
+        cacheTables[path] = MappedTable(path, slots, fingerprint=getTableFingerprint(weights, size=size))
+    return cacheTables[path]
+
+# writes one result per line as it arrives: 'jsonl' (one JSON object per line) or 'csv'
+class ResultWriter:
+    def __init__(self, out, fmt='jsonl', fields=RESULT_FIELDS):
+        if fmt not in ('jsonl', 'csv'):
+            raise ValueError(f'unknown result format: {fmt}')
+        self.out = out
+        self.fmt = fmt
+        self.csvWriter = None
+        if fmt == 'csv':
+            self.csvWriter = csv.DictWriter(out, fieldnames=fields, extrasaction='ignore')
+            self.csvWriter.writeheader()
+
+    def write(self, result):
+        if self.csvWriter:
+            self.csvWriter.writerow(result)
+        else:
+            self.out.write(json.dumps(result) + '\n')
+        self.out.flush()
+
+def runGames(numGames, out, fmt='jsonl', seed=None, maxDepth=2, maxMoves=None, timeLimit=None,
+             recorder=None, commonSpawns=False, size=4, cachePath=None, mode='expectimax',
+             playouts=200, playoutDepth=None):
+    writer = ResultWriter(out, fmt)
+    results = []
+    for game in range(numGames):
+        gameSeed = None if seed is None else seed + game
+        result = playGame(game, gameSeed, maxDepth, maxMoves, timeLimit, recorder, commonSpawns,
+                          size=size, cachePath=cachePath, mode=mode, playouts=playouts,
+                          playoutDepth=playoutDepth)
+        writer.write(result)
+        results.append(result)
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Play 2048 AI games without graphics.')
+    parser.add_argument('--games', type=int, default=1, help='number of games to play')
+    parser.add_argument('--depth', type=int, default=2, help='search depth')
+    parser.add_argument('--mode', choices=AISolver.MODES, default='expectimax',
+                        help='search engine (minimax assumes the worst spawn instead of a random one)')
+    parser.add_argument('--playouts', type=int, default=200, help='montecarlo playouts per root move')
+    parser.add_argument('--playout-depth', type=int, default=None,
+                        help='montecarlo playout length in moves (default: play to the end of the game)')
+    parser.add_argument('--seed', type=int, default=None, help='seed of the first game (game i uses seed+i)')
+    parser.add_argument('--max-moves', type=int, default=None, help='stop each game after this many moves')
+    parser.add_argument('--time-limit', type=float, default=None,
+                        help='per-move time budget in seconds (iterative deepening instead of --depth)')
+    parser.add_argument('--format', choices=['jsonl', 'csv'], default='jsonl')
+    parser.add_argument('--output', default='-', help="output file ('-' for stdout)")
+    parser.add_argument('--record', default=None, help='also write every game to this binary record file')
+    parser.add_argument('--common-spawns', action='store_true',
+                        help='same seed -> same spawn random numbers for any solver settings')
+    parser.add_argument('--size', type=int, default=4, help='board size (3 to 8)')
+    parser.add_argument('--cache', default=None,
+                        help='persistent transposition table file, created if missing and reused by later runs')
+    args = parser.parse_args(argv)
+
+    recordFile = open(args.record, 'wb') if args.record else None
+    recorder = RecordWriter(recordFile) if recordFile else None
+    try:
+        if args.output == '-':
+            runGames(args.games, sys.stdout, args.format, args.seed, args.depth, args.max_moves,
+                     args.time_limit, recorder, args.common_spawns, args.size, args.cache, args.mode,
+                     args.playouts, args.playout_depth)
+        else:
+            with open(args.output, 'w', newline='') as out:
+                runGames(args.games, out, args.format, args.seed, args.depth, args.max_moves,
+                         args.time_limit, recorder, args.common_spawns, args.size, args.cache, args.mode,
+                         args.playouts, args.playout_depth)
+    finally:
+        if recordFile:
+            recordFile.close()
+
+if __name__ == '__main__':
+    main()
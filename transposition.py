@@ -0,0 +1,260 @@
+import hashlib
+import mmap
+import os
+import struct
+from collections import OrderedDict
+import weakref
+from multiprocessing import shared_memory
+try:
+    import fcntl
+except ImportError: # not available on Windows; table files are then created without a lock
+    fcntl = None
+
+#=================================================================================================
+# Transposition table for expectimax: maps (packed board, remaining depth) -> expected value.
+# Different move orders often reach the same board, so values are shared across the whole
+# search and across consecutive getNextMove calls. Memory is bounded by a maximum number of
+# entries (or an approximate byte budget); once full, the least recently used entry is evicted.
+#=================================================================================================
+
+class TranspositionTable:
+    # rough cost of one OrderedDict slot holding a (state, depth) tuple key and a float value
+    BYTES_PER_ENTRY = 200
+
+    def __init__(self, maxEntries=500000, maxBytes=None):
+        if maxBytes is not None:
+            maxEntries = maxBytes // TranspositionTable.BYTES_PER_ENTRY
+        self.maxEntries = max(1, maxEntries)
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, state, depth):
+        key = (state, depth)
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, state, depth, value):
+        key = (state, depth)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+        elif len(self.entries) >= self.maxEntries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+        self.entries[key] = value
+
+    def clear(self):
+        self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def getStats(self):
+        lookups = self.hits + self.misses
+        return {'size': len(self.entries),
+                'maxEntries': self.maxEntries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hitRate': self.hits / lookups if lookups else 0}
+
+#=================================================================================================
+# Fixed-size open-addressing table over a flat buffer, shared by every process that maps the
+# same memory. Each slot holds (check word, depth, value bits) as three 64-bit words:
+# - a (state, depth) pair hashes (splitmix64, identical in every process) to a home slot and may
+#   live in any of the next PROBES slots; depth 0 marks an empty slot
+# - the check word is state ^ value bits ^ mixed depth, so a slot read while another process was
+#   halfway through writing it fails the check and counts as a miss (lockless hashing, as in
+#   Hyatt & Mann's "A lock-less transposition table implementation for parallel search")
+# - when all PROBES slots are taken, the shallowest entry is replaced, since it is the cheapest
+#   one to recompute
+# Only states below 2**64 (boards up to 4x4) can be stored; other states are never cached.
+#=================================================================================================
+
+MASK64 = (1 << 64) - 1
+
+def mixHash(x):
+    x = (x + 0x9E3779B97F4A7C15) & MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & MASK64
+    return x ^ (x >> 31)
+
+class SlotTable:
+    SLOT = struct.Struct('<QQQ')
+    VALUE = struct.Struct('<d')
+    PROBES = 4
+
+    def __init__(self, buffer, offset, slots):
+        self.buffer = buffer
+        self.offset = offset
+        self.slots = slots
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stored = 0
+
+    def getHomeSlot(self, state, depth):
+        return mixHash(state ^ (depth << 58)) % self.slots
+
+    def get(self, state, depth):
+        if state > MASK64:
+            return None
+        home = self.getHomeSlot(state, depth)
+        depthMix = mixHash(depth)
+        for probe in range(self.PROBES):
+            slotOffset = self.offset + ((home + probe) % self.slots) * self.SLOT.size
+            check, slotDepth, valueBits = self.SLOT.unpack_from(self.buffer, slotOffset)
+            if slotDepth == depth and check ^ valueBits ^ depthMix == state:
+                self.hits += 1
+                return self.VALUE.unpack_from(self.buffer, slotOffset + 16)[0]
+            if slotDepth == 0:
+                break
+        self.misses += 1
+        return None
+
+    def put(self, state, depth, value):
+        if state > MASK64:
+            return
+        home = self.getHomeSlot(state, depth)
+        depthMix = mixHash(depth)
+        valueBits = int.from_bytes(self.VALUE.pack(value), 'little')
+        target = None
+        targetDepth = None
+        for probe in range(self.PROBES):
+            slotOffset = self.offset + ((home + probe) % self.slots) * self.SLOT.size
+            check, slotDepth, slotBits = self.SLOT.unpack_from(self.buffer, slotOffset)
+            if slotDepth == 0:
+                target = slotOffset
+                self.stored += 1
+                break
+            if slotDepth == depth and check ^ slotBits ^ depthMix == state:
+                target = slotOffset
+                break
+            if target is None or slotDepth < targetDepth:
+                target = slotOffset
+                targetDepth = slotDepth
+        else:
+            self.evictions += 1
+        self.SLOT.pack_into(self.buffer, target, state ^ valueBits ^ depthMix, depth, valueBits)
+
+    def clear(self):
+        self.buffer[self.offset:self.offset + self.slots * self.SLOT.size] = bytes(self.slots * self.SLOT.size)
+
+    # counts the occupied slots, so it scans the whole table
+    def __len__(self):
+        return sum(1 for slot in range(self.slots)
+                   if self.SLOT.unpack_from(self.buffer, self.offset + slot * self.SLOT.size)[1])
+
+    # size is the number of empty slots this process has filled (len() scans for the real count)
+    def getStats(self):
+        lookups = self.hits + self.misses
+        return {'size': self.stored,
+                'maxEntries': self.slots,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hitRate': self.hits / lookups if lookups else 0}
+
+# SlotTable in a memory-mapped file, so cached values survive the process and warm-start later
+# runs; any number of processes can map the same file and read and write it at once. The file
+# header records the slot count and a fingerprint of the settings the values were computed with
+# (see ai.getTableFingerprint), and opening a file with a different fingerprint fails, since its
+# values would be wrong for this solver. A new file is created with `slots` slots (or as many as
+# fit in maxBytes).
+class MappedTable(SlotTable):
+    MAGIC = b'2048TT01'
+    HEADER = struct.Struct('<8sQ20s')
+
+    def __init__(self, path, slots=1 << 20, maxBytes=None, fingerprint='', readOnly=False):
+        if maxBytes is not None:
+            slots = max(1, (maxBytes - MappedTable.HEADER.size) // SlotTable.SLOT.size)
+        self.path = path
+        self.readOnly = readOnly
+        digest = hashlib.sha1(fingerprint.encode()).digest()
+        self.file = open(path, 'rb' if readOnly else 'a+b')
+        if fcntl is not None:
+            fcntl.flock(self.file, fcntl.LOCK_SH if readOnly else fcntl.LOCK_EX)
+        try:
+            self.file.seek(0, os.SEEK_END)
+            if self.file.tell() == 0 and not readOnly:
+                self.file.write(MappedTable.HEADER.pack(MappedTable.MAGIC, slots, digest))
+                self.file.truncate(MappedTable.HEADER.size + slots * SlotTable.SLOT.size)
+                self.file.flush()
+            self.file.seek(0)
+            magic, slots, fileDigest = MappedTable.HEADER.unpack(self.file.read(MappedTable.HEADER.size))
+        finally:
+            if fcntl is not None:
+                fcntl.flock(self.file, fcntl.LOCK_UN)
+        if magic != MappedTable.MAGIC:
+            self.file.close()
+            raise ValueError(f'{path} is not a transposition table file')
+        if fileDigest != digest:
+            self.file.close()
+            raise ValueError(f'{path} was written with different solver settings')
+        access = mmap.ACCESS_READ if readOnly else mmap.ACCESS_WRITE
+        self.map = mmap.mmap(self.file.fileno(), MappedTable.HEADER.size + slots * SlotTable.SLOT.size,
+                             access=access)
+        super().__init__(self.map, MappedTable.HEADER.size, slots)
+
+    def put(self, state, depth, value):
+        if not self.readOnly:
+            super().put(state, depth, value)
+
+    def clear(self):
+        if not self.readOnly:
+            super().clear()
+
+    def flush(self):
+        if not self.readOnly:
+            self.map.flush()
+
+    def close(self):
+        self.flush()
+        self.map.close()
+        self.file.close()
+
+# SlotTable in a multiprocessing.shared_memory block, so the search workers of one host share a
+# single table instead of each filling a private one. The creating process owns the block (and
+# unlinks it in close()); workers attach by name with the same slot count, and since slots are
+# found by hashing the state, a board maps to the same slot in every process. No locks are taken:
+# a slot torn by two concurrent writers fails its check word and reads as a miss.
+# Workers started by multiprocessing share the owner's resource tracker, so attaching leaves the
+# owner's registration alone; the block is unlinked by close(), or at exit if close() was never
+# called.
+class SharedTable(SlotTable):
+    def __init__(self, slots=1 << 20, maxBytes=None, name=None):
+        if maxBytes is not None:
+            slots = max(1, maxBytes // SlotTable.SLOT.size)
+        self.owner = name is None
+        if self.owner:
+            self.memory = shared_memory.SharedMemory(create=True, size=slots * SlotTable.SLOT.size)
+            self.finalizer = weakref.finalize(self, SharedTable.release, self.memory)
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+        super().__init__(self.memory.buf, 0, slots)
+
+    @staticmethod
+    def release(memory):
+        memory.unlink()
+        memory.close()
+
+    @property
+    def name(self):
+        return self.memory.name
+
+    # what a worker needs to attach: SharedTable(slots, name=name)
+    def getAddress(self):
+        return (self.name, self.slots)
+
+    def close(self):
+        self.buffer = None
+        if self.owner:
+            self.finalizer()
+        else:
+            self.memory.close()
@@ -0,0 +1,190 @@
+import argparse
+import json
+import math
+import os
+import sys
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+import heuristics
+from simulate import playGame
+
+#=================================================================================================
+# Heuristic-weight tuner: CMA-ES over the weights of calculateFinalScore (heuristics.DEFAULT_WEIGHTS,
+# including the inner merge weights), searched in log space so every weight stays positive and
+# is scaled multiplicatively.
+# Each generation's candidates are scored by successive halving: every candidate plays a few
+# games, the best 1/eta keep playing eta times as many, and so on, so weak candidates cost only a
+# few games. All candidates of a generation play the same seeds with common spawns (see
+# board.SpawnStream), which keeps the comparison fair with few games. Games run on a process pool.
+# The optimizer state is written to the checkpoint after every generation and picked up again
+# when the tuner is started with the same checkpoint path.
+# Example: python tune.py --generations 50 --workers 16 --checkpoint tune.json
+#=================================================================================================
+
+PARAMETERS = list(heuristics.DEFAULT_WEIGHTS)
+
+def toVector(weights):
+    return [math.log(weights[name]) for name in PARAMETERS]
+
+def toWeights(vector):
+    return {name: math.exp(value) for name, value in zip(PARAMETERS, vector)}
+
+# CMA-ES with the default strategy parameters (Hansen, "The CMA Evolution Strategy: A Tutorial");
+# ask() samples a population, tell() takes it back ranked best first
+class CMAES:
+    def __init__(self, mean, sigma, population=None, seed=None):
+        n = len(mean)
+        self.n = n
+        self.population = population or 4 + int(3 * math.log(n))
+        self.mu = self.population // 2
+        weights = np.log(self.mu + 0.5) - np.log(np.arange(1, self.mu + 1))
+        self.weights = weights / weights.sum()
+        self.mueff = 1 / np.sum(self.weights ** 2)
+        self.cc = (4 + self.mueff/n) / (n + 4 + 2*self.mueff/n)
+        self.cs = (self.mueff + 2) / (n + self.mueff + 5)
+        self.c1 = 2 / ((n + 1.3)**2 + self.mueff)
+        self.cmu = min(1 - self.c1, 2 * (self.mueff - 2 + 1/self.mueff) / ((n + 2)**2 + self.mueff))
+        self.damps = 1 + 2 * max(0, math.sqrt((self.mueff - 1) / (n + 1)) - 1) + self.cs
+        self.chiN = math.sqrt(n) * (1 - 1/(4*n) + 1/(21*n*n))
+        self.mean = np.array(mean, dtype=float)
+        self.sigma = sigma
+        self.C = np.eye(n)
+        self.pc = np.zeros(n)
+        self.ps = np.zeros(n)
+        self.generation = 0
+        self.rng = np.random.default_rng(seed)
+
+    def ask(self):
+        eigenvalues, B = np.linalg.eigh(self.C)
+        D = np.sqrt(np.maximum(eigenvalues, 1e-20))
+        z = self.rng.standard_normal((self.population, self.n))
+        return [self.mean + self.sigma * (B @ (D * row)) for row in z]
+
+    def tell(self, rankedSolutions):
+        n = self.n
+        x = np.array(rankedSolutions[:self.mu])
+        oldMean = self.mean
+        self.mean = self.weights @ x
+        y = (self.mean - oldMean) / self.sigma
+        eigenvalues, B = np.linalg.eigh(self.C)
+        D = np.sqrt(np.maximum(eigenvalues, 1e-20))
+        invSqrtC = B @ np.diag(1 / D) @ B.T
+        self.ps = (1 - self.cs) * self.ps + math.sqrt(self.cs * (2 - self.cs) * self.mueff) * (invSqrtC @ y)
+        psNorm = np.linalg.norm(self.ps)
+        hsig = psNorm / math.sqrt(1 - (1 - self.cs) ** (2 * (self.generation + 1))) / self.chiN < 1.4 + 2/(n + 1)
+        self.pc = (1 - self.cc) * self.pc + hsig * math.sqrt(self.cc * (2 - self.cc) * self.mueff) * y
+        steps = (x - oldMean) / self.sigma
+        self.C = ((1 - self.c1 - self.cmu) * self.C +
+                  self.c1 * (np.outer(self.pc, self.pc) + (1 - hsig) * self.cc * (2 - self.cc) * self.C) +
+                  self.cmu * (steps.T * self.weights) @ steps)
+        self.sigma *= math.exp((self.cs / self.damps) * (psNorm / self.chiN - 1))
+        self.generation += 1
+
+    def getState(self):
+        return {'population': self.population,
+                'mean': self.mean.tolist(),
+                'sigma': self.sigma,
+                'C': self.C.tolist(),
+                'pc': self.pc.tolist(),
+                'ps': self.ps.tolist(),
+                'generation': self.generation,
+                'rng': self.rng.bit_generator.state}
+
+    @classmethod
+    def fromState(cls, state):
+        es = cls(state['mean'], state['sigma'], state['population'])
+        es.C = np.array(state['C'])
+        es.pc = np.array(state['pc'])
+        es.ps = np.array(state['ps'])
+        es.generation = state['generation']
+        es.rng.bit_generator.state = state['rng']
+        return es
+
+def playCandidateGame(task):
+    weights, seed, maxDepth, maxMoves = task
+    return playGame(seed=seed, maxDepth=maxDepth, maxMoves=maxMoves, commonSpawns=True,
+                    weights=weights)['score']
+
+# successive halving over one generation: rung r tops every survivor up to minGames * eta**r games
+# (the same seeds for everyone), then keeps the best ceil(survivors / eta). Returns the candidate
+# indices ranked best first (by last rung reached, then mean score) and every candidate's scores.
+def successiveHalving(pool, candidates, seeds, minGames, eta, rungs, maxDepth, maxMoves):
+    scores = [[] for candidate in candidates]
+    reached = [0] * len(candidates)
+    alive = list(range(len(candidates)))
+    for rung in range(rungs):
+        games = min(len(seeds), minGames * eta ** rung)
+        tasks = [(index, seed) for index in alive for seed in seeds[len(scores[index]):games]]
+        results = pool.map(playCandidateGame,
+                           [(candidates[index], seed, maxDepth, maxMoves) for index, seed in tasks])
+        for (index, seed), score in zip(tasks, results):
+            scores[index].append(score)
+        for index in alive:
+            reached[index] = rung
+        if len(alive) == 1 or rung == rungs - 1:
+            break
+        alive.sort(key=lambda index: -np.mean(scores[index]))
+        alive = alive[:math.ceil(len(alive) / eta)]
+    ranking = sorted(range(len(candidates)), key=lambda index: (-reached[index], -np.mean(scores[index])))
+    return ranking, scores
+
+def saveCheckpoint(path, checkpoint):
+    tmpPath = path + '.tmp'
+    with open(tmpPath, 'w') as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmpPath, path)
+
+def tune(generations, checkpointPath=None, population=None, sigma=0.5, workers=None, minGames=2,
+         eta=3, rungs=3, maxDepth=1, maxMoves=None, seed=0):
+    if checkpointPath and os.path.exists(checkpointPath):
+        with open(checkpointPath) as f:
+            checkpoint = json.load(f)
+        es = CMAES.fromState(checkpoint['es'])
+        print(f'resuming from {checkpointPath} at generation {es.generation}', file=sys.stderr)
+    else:
+        es = CMAES(toVector(heuristics.DEFAULT_WEIGHTS), sigma, population, seed)
+        checkpoint = {'parameters': PARAMETERS, 'history': []}
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        while es.generation < generations:
+            solutions = es.ask()
+            candidates = [toWeights(solution) for solution in solutions]
+            # fresh seeds every generation so the weights don't overfit a fixed set of games
+            gameSeeds = [seed + es.generation * 100000 + game for game in range(minGames * eta ** (rungs - 1))]
+            ranking, scores = successiveHalving(pool, candidates, gameSeeds, minGames, eta, rungs,
+                                                maxDepth, maxMoves)
+            es.tell([solutions[index] for index in ranking])
+            best = ranking[0]
+            checkpoint['history'].append({'generation': es.generation,
+                                          'bestWeights': candidates[best],
+                                          'bestMeanScore': float(np.mean(scores[best])),
+                                          'bestGames': len(scores[best]),
+                                          'games': sum(len(s) for s in scores),
+                                          'sigma': es.sigma})
+            checkpoint['meanWeights'] = toWeights(es.mean)
+            checkpoint['es'] = es.getState()
+            if checkpointPath:
+                saveCheckpoint(checkpointPath, checkpoint)
+            print(json.dumps(checkpoint['history'][-1]), file=sys.stderr)
+    return checkpoint
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Tune the heuristic weights with CMA-ES and successive halving.')
+    parser.add_argument('--generations', type=int, default=20, help='total generations (including resumed ones)')
+    parser.add_argument('--population', type=int, default=None, help='candidates per generation (default: CMA-ES default)')
+    parser.add_argument('--sigma', type=float, default=0.5, help='initial step size in log-weight space')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: all cores)')
+    parser.add_argument('--min-games', type=int, default=2, help='games per candidate in the first rung')
+    parser.add_argument('--eta', type=int, default=3, help='keep 1/eta of the candidates per rung, eta times the games')
+    parser.add_argument('--rungs', type=int, default=3, help='successive halving rungs per generation')
+    parser.add_argument('--depth', type=int, default=1, help='expectimax search depth of the tuning games')
+    parser.add_argument('--max-moves', type=int, default=None, help='stop each tuning game after this many moves')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--checkpoint', default=None, help='state file, written every generation and resumed from')
+    args = parser.parse_args(argv)
+
+    checkpoint = tune(args.generations, args.checkpoint, args.population, args.sigma, args.workers,
+                      args.min_games, args.eta, args.rungs, args.depth, args.max_moves, args.seed)
+    print(json.dumps(checkpoint.get('meanWeights'), indent=2))
+
+if __name__ == '__main__':
+    main()